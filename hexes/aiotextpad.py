@@ -1,7 +1,9 @@
 import curses
+import curses.ascii
 import curses.textpad
 from functools import partial
-from .behaviors import _edit
+from .scheduler import INPUT
+from .text import GapBuffer
 
 
 class AsyncTextbox(curses.textpad.Textbox):
@@ -29,7 +31,32 @@ class AsyncTextbox(curses.textpad.Textbox):
 
     KEY_LEFT = Ctrl-B, KEY_RIGHT = Ctrl-F, KEY_UP = Ctrl-P, KEY_DOWN = Ctrl-N
     KEY_BACKSPACE = Ctrl-h
+
+    Other keys can be bound with :py:meth:`bind`.
     """
+
+    # Maps key codes to the names of the methods that handle them.
+    commands = {
+        curses.ascii.SOH: 'ctrl_a',
+        curses.ascii.STX: 'leftward_key',
+        curses.KEY_LEFT: 'leftward_key',
+        curses.ascii.BS: 'leftward_key',
+        curses.KEY_BACKSPACE: 'leftward_key',
+        curses.ascii.EOT: 'ctrl_d',
+        curses.ascii.ENQ: 'ctrl_e',
+        curses.ascii.ACK: 'ctrl_f',
+        curses.KEY_RIGHT: 'ctrl_f',
+        curses.ascii.BEL: 'ctrl_g',
+        curses.ascii.NL: 'ctrl_j',
+        curses.ascii.VT: 'ctrl_k',
+        curses.ascii.FF: 'ctrl_l',
+        curses.ascii.SO: 'ctrl_n',
+        curses.KEY_DOWN: 'ctrl_n',
+        curses.ascii.SI: 'ctrl_o',
+        curses.ascii.DLE: 'ctrl_p',
+        curses.KEY_UP: 'ctrl_p',
+    }
+
     def __init__(self, win, box, app, insert_mode=False):
         self.win = win
         self.box = box
@@ -41,17 +68,39 @@ class AsyncTextbox(curses.textpad.Textbox):
         self.stripspaces = 1
         self.lastcmd = None
         self.is_active = False
+        self.validate = None
+        self.validate_paste = None
+        self.callback = None
         self.characters = ""
-        self._cursor = 0
+        self._commands = {
+            ch: getattr(self, name)
+            for ch, name in self.commands.items()
+        }
         self.win.keypad(1)
 
+    @property
+    def characters(self):
+        """
+        Returns
+        -------
+        str
+            The text typed so far. It is kept in a :py:class:`.GapBuffer`,
+            and only turned into a string when read after a change.
+        """
+
+        return str(self._buffer)
+
+    @characters.setter
+    def characters(self, val):
+        self._buffer = GapBuffer(val)
+
     @property
     def cursor(self):
-        return self._cursor
+        return self._buffer.cursor
 
     @cursor.setter
     def cursor(self, val):
-        self._cursor = self.bounded(val, 0, len(self.characters))
+        self._buffer.move(self.bounded(val, 0, len(self._buffer)))
 
     @staticmethod
     def bounded(val, min_, max_):
@@ -62,16 +111,85 @@ class AsyncTextbox(curses.textpad.Textbox):
             max(min_, val)
         )
 
-    def edit(self, validate=None, callback=None):
+    def edit(self, validate=None, callback=None, validate_paste=None):
+        """
+        Start editing, and give the box focus. Keys typed from now on are
+        passed to :py:meth:`process_key` by the application, until editing
+        stops.
+
+        Keyword Arguments
+        -----------------
+        validate : function in (ch: int)
+            Called with each key before it is processed, returning the key
+            to process instead.
+        callback : coroutine function in (app, textbox, characters)
+            Scheduled with the text once editing stops.
+        validate_paste : function in (text: str)
+            Called once with the whole of any pasted text, returning the text
+            to insert instead. See :py:meth:`paste`.
+        """
+
         self.is_active = True
-        self.app.schedule(
-            partial(
-                _edit,
-                textbox=self,
-                validate=validate,
-                callback=callback,
-            )
-        )
+        self.validate = validate
+        self.validate_paste = validate_paste
+        self.callback = callback
+        self.app.focus.set(self.box, textbox=self)
+        self.box.damage()
+
+    def process_key(self, ch):
+        """
+        Process a key typed while editing.
+
+        Arguments
+        ---------
+        ch : int
+            The key code, as returned by ``getch``.
+        """
+
+        if self.validate:
+            ch = self.validate(ch)
+        if not self.do_command(ch):
+            self.is_active = False
+            self.box.text = ''
+            if callable(self.callback):
+                self.app.schedule(
+                    partial(
+                        self.callback,
+                        textbox=self,
+                        characters=self.characters,
+                    ),
+                    priority=INPUT,
+                )
+        else:
+            # The box is drawn from the textbox while editing.
+            self.box.damage()
+
+    def paste(self, text):
+        """
+        Insert pasted text at the cursor in one go.
+
+        If editing was started with `validate_paste`, it is called once with
+        the text first. Otherwise, if it was started with `validate` only,
+        the text is typed in key by key through :py:meth:`process_key`, so
+        that `validate` sees every key as it would have without bracketed
+        paste.
+
+        Arguments
+        ---------
+        text : str
+        """
+
+        if self.validate_paste:
+            text = self.validate_paste(text)
+        elif self.validate:
+            for ch in text.encode('utf-8'):
+                if not self.is_active:
+                    break
+                self.process_key(ch)
+            return
+        if text:
+            self._buffer.insert(text)
+            self.box.damage()
 
     def ctrl_a(self, ch, x, y):
         self.win.move(y, 0)
@@ -135,10 +253,7 @@ class AsyncTextbox(curses.textpad.Textbox):
         else:
             self.win.move(y - 1, self.maxx)
         if ch in (curses.ascii.BS, curses.KEY_BACKSPACE):
-            self.characters = (
-                self.characters[:self.cursor]
-                + self.characters[self.cursor + 1:]
-            )
+            self._buffer.delete()
         return True
 
     def do_printable_char(self, ch, x, y):
@@ -148,11 +263,7 @@ class AsyncTextbox(curses.textpad.Textbox):
 
     def _insert_printable_char(self, ch):
         # @TODO This doesn't do all the things of the super that it should.
-        ch = chr(ch)
-        self.characters = (
-            self.characters[:self.cursor] + ch + self.characters[self.cursor:]
-        )
-        self.cursor += 1
+        self._buffer.insert(chr(ch))
 
         # Super:
         # (y, x) = self.win.getyx()
@@ -172,49 +283,32 @@ class AsyncTextbox(curses.textpad.Textbox):
         #             self._insert_printable_char(oldch)
         #             self.win.move(backy, backx)
 
+    def bind(self, ch, handler):
+        """
+        Run `handler` for the key `ch` instead of its usual command.
+
+        Arguments
+        ---------
+        ch : int or str
+            The key code, or a single character.
+        handler : callable
+            Called as ``handler(textbox, ch, x, y)``, with the cursor
+            position. Its return value is returned from
+            :py:meth:`do_command`, so return something falsy to stop
+            editing.
+        """
+
+        if isinstance(ch, str):
+            ch = ord(ch)
+        self._commands[ch] = partial(handler, self)
+
     def do_command(self, ch):
         "Process a single editing command."
         y, x = self.win.getyx()
         self.lastcmd = ch
-        leftward_keys = (
-            curses.ascii.STX,
-            curses.KEY_LEFT,
-            curses.ascii.BS,
-            curses.KEY_BACKSPACE,
-        )
-        rightward_keys = (
-            curses.ascii.ACK,
-            curses.KEY_RIGHT,
-        )
-        downward_keys = (
-            curses.ascii.SO,
-            curses.KEY_DOWN,
-        )
-        upward_keys = (
-            curses.ascii.DLE,
-            curses.KEY_UP,
-        )
-        # This is a tuple of 2-tuples of (predicate, action)
-        the_big_map = (
-            (lambda ch: curses.ascii.isprint(ch), self.do_printable_char),
-            (lambda ch: ch == curses.ascii.SOH, self.ctrl_a),
-            (lambda ch: ch in leftward_keys, self.leftward_key),
-            (lambda ch: ch == curses.ascii.EOT, self.ctrl_d),
-            (lambda ch: ch == curses.ascii.ENQ, self.ctrl_e),
-            (lambda ch: ch in rightward_keys, self.ctrl_f),
-            (lambda ch: ch == curses.ascii.BEL, self.ctrl_g),
-            (lambda ch: ch == curses.ascii.NL, self.ctrl_j),
-            (lambda ch: ch == curses.ascii.VT, self.ctrl_k),
-            (lambda ch: ch == curses.ascii.FF, self.ctrl_l),
-            (lambda ch: ch in downward_keys, self.ctrl_n),
-            (lambda ch: ch == curses.ascii.SI, self.ctrl_o),
-            (lambda ch: ch in upward_keys, self.ctrl_p),
-        )
-
-        ret = ch
-        for i, (predicate, action) in enumerate(the_big_map):
-            if predicate(ch):
-                ret = action(ch, x, y)
-                if ret is not None:
-                    return ret
-        return ret
+        action = self._commands.get(ch)
+        if action is not None:
+            return action(ch, x, y)
+        if curses.ascii.isprint(ch):
+            return self.do_printable_char(ch, x, y)
+        return ch
@@ -3,21 +3,49 @@ This module contains the core concepts of Hexes:
 
 * :py:class:`.Style`
 * :py:class:`.Box`
+* :py:class:`.FocusManager`
 * :py:class:`.Application`
 """
 
 import asyncio
 import curses
 import logging
-from collections import defaultdict
+import sys
+from collections import (
+    OrderedDict,
+    defaultdict,
+    namedtuple,
+)
+from functools import partial
 from math import floor
+from weakref import WeakSet
 from .aiotextpad import AsyncTextbox
 from .utils import (
+    Geometry,
     Point,
+    WrapCache,
     flatten,
     wrap_by_paragraph,
 )
 from .behaviors import render
+from .keys import (
+    PASTE_OFF,
+    PASTE_ON,
+    KeyMap,
+    KeySequencer,
+    PasteParser,
+)
+from .scheduler import (
+    BACKGROUND,
+    INPUT,
+    RENDER,
+    Scheduler,
+)
+from .sources import StreamSource
+from .text import (
+    LineRing,
+    Rope,
+)
 
 
 class Style(object):
@@ -38,7 +66,9 @@ class Style(object):
         Width in character cells, or "fit to available space".
     flow : bool
         Indicating whether text in the box should be reflowed to fit, or
-        printed literally. Default: `False`.
+        printed literally. Reflowing wraps the whole text again whenever it
+        changes, so unlike literal text, drawing a flowed box costs more the
+        longer its text; keep it for short texts. Default: `False`.
     """
     class Layout:
         Vertical = "vertical"
@@ -60,6 +90,12 @@ class Style(object):
 
     def __init__(self, **kwargs):
         self.__dict__.update(**kwargs)
+        self.__dict__['_boxes'] = WeakSet()
+
+    def __setattr__(self, name, value):
+        super().__setattr__(name, value)
+        for box in list(self._boxes):
+            box.invalidate_layout()
 
 
 class Box(object):
@@ -80,22 +116,39 @@ class Box(object):
     children : list of :py:class:`.Box`
         A list of child boxes, to be laid out according to the `style`
         attribute.
+    max_lines : int
+        If given, only the last `max_lines` lines of text are kept, as in a
+        terminal's scrollback.
+    max_bytes : int
+        If given, only as many of the last lines of text as fit in
+        `max_bytes` bytes are kept.
     """
     def __init__(self,
                  title=None,
                  style=None,
                  text=None,
                  editable=False,
-                 children=None):
-        self.title = title
-        self.style = style or Style()
-        self.editable = editable
+                 children=None,
+                 max_lines=None,
+                 max_bytes=None):
+        self._title = title
         self.parent = None
-        self._text = text
-        self._text_offset = 0
+        self.children = []
+        self.application = None
+        self.dirty = False
         self._available_height = None
         self._available_width = None
-        self.children = []
+        self._layout_table = None
+        self._layout_pending = set()
+        self._layout_dirty = False
+        self.style = style or Style()
+        self.editable = editable
+        self.max_lines = max_lines
+        self.max_bytes = max_bytes
+        self._buffer = None if text is None else self._new_buffer(text)
+        # A ring may not have kept all of it.
+        self._text = text if isinstance(self._buffer, Rope) else None
+        self._text_offset = 0
         children = children or []
         self.add_children(*children)
 
@@ -117,7 +170,10 @@ class Box(object):
             The box to append.
         """
         child.parent = self
+        child._layout_table = None
+        child._layout_pending = set()
         self.children.append(child)
+        child.invalidate_layout()
 
     def add_children(self, *children):
         """
@@ -129,6 +185,43 @@ class Box(object):
         for child in children:
             self.add_child(child)
 
+    @property
+    def title(self):
+        """
+        Returns
+        -------
+        str
+            The short string shown in the upper left of the box.
+        """
+
+        return self._title
+
+    @title.setter
+    def title(self, val):
+        self._title = val
+        self.damage()
+
+    @property
+    def style(self):
+        """
+        Returns
+        -------
+        :py:class:`.Style`
+            The style of the box. Changing any of its attributes invalidates
+            the layout of the box.
+        """
+
+        return self._style
+
+    @style.setter
+    def style(self, val):
+        old = getattr(self, '_style', None)
+        if old is not None:
+            old._boxes.discard(self)
+        val._boxes.add(self)
+        self._style = val
+        self.invalidate_layout()
+
     @property
     def ancestors(self):
         """
@@ -208,7 +301,117 @@ class Box(object):
 
         return self.older_siblings + [self] + self.younger_siblings
 
-    def __available_dimension(self, main):
+    def layout(self):
+        """
+        Bring the geometry of every box in the tree up to date.
+
+        The first call computes the whole tree in a single pass. After that,
+        only the subtrees marked by :py:meth:`invalidate_layout` are measured
+        and placed again. The results are stored in a layout table on the root
+        box, which :py:attr:`available_height`, :py:attr:`available_width`,
+        :py:attr:`height`, :py:attr:`width`, :py:attr:`upper_left` and
+        :py:attr:`lower_right` read from instead of recomputing.
+
+        Returns
+        -------
+        set of :py:class:`.Box`
+            The boxes whose geometry changed.
+        """
+
+        root = self.root
+        pending = root._layout_pending
+        root._layout_pending = set()
+        table = root._layout_table
+        if table is None or root in pending:
+            sizes = {}
+            root._measure(
+                sizes,
+                root._root_available("width"),
+                root._root_available("height"),
+            )
+            fresh = {}
+            root._place(fresh, sizes, Point(0, 0))
+            root._layout_table = fresh
+            if table is None:
+                return set(fresh)
+            return {
+                box for box, geometry in fresh.items()
+                if table.get(box) != geometry
+            }
+
+        changed = set()
+        for node in sorted(pending, key=lambda box: len(box.ancestors)):
+            # Already redone as part of a shallower pending subtree.
+            if not node._layout_dirty:
+                continue
+            geometry = table[node]
+            sizes = {}
+            node._measure(
+                sizes,
+                geometry.available_width,
+                geometry.available_height,
+            )
+            fresh = {}
+            node._place(fresh, sizes, Point(geometry.x, geometry.y))
+            for box, geometry in fresh.items():
+                if table.get(box) != geometry:
+                    table[box] = geometry
+                    changed.add(box)
+        return changed
+
+    def invalidate_layout(self):
+        """
+        Mark the geometry of this box as stale.
+
+        Siblings share their parent's space, so the parent is marked dirty
+        rather than the box itself. The mark then moves up through any
+        ancestors whose size is the sum of their children's, stopping at the
+        first one whose size does not depend on this box. The next
+        :py:meth:`layout` only redoes that ancestor's subtree.
+        """
+
+        node = self.parent if self.parent is not None else self
+        while node.parent is not None and node._sized_by_children:
+            node = node.parent
+        node._layout_dirty = True
+        root = node.root
+        root._layout_pending.add(node)
+        if root.application is not None:
+            root.application.request_render()
+
+    @property
+    def _sized_by_children(self):
+        return any(
+            type(getattr(self.style, main)) != int
+            and getattr(self.style, main) != auto_dimension
+            for main, auto_dimension in (
+                ("width", Style.Width.Auto),
+                ("height", Style.Height.Auto),
+            )
+        )
+
+    @property
+    def _geometry(self):
+        root = self.root
+        if root._layout_table is None or root._layout_pending:
+            root.layout()
+        return root._layout_table[self]
+
+    def _root_available(self, main):
+        if getattr(self, '_available_{}'.format(main)) is not None:
+            return getattr(self, '_available_{}'.format(main))
+        if type(getattr(self.style, main)) == int:
+            return getattr(self.style, main)
+        return 2
+
+    def _children_available(self, main, available):
+        """
+        The available `main` dimension of each child, given this box's own.
+
+        The sums over siblings are taken once for all of the children, rather
+        than once per child.
+        """
+
         if main == "height":
             full_dimension = Style.Layout.Horizontal
             divided_dimension = Style.Layout.Vertical
@@ -218,37 +421,122 @@ class Box(object):
             divided_dimension = Style.Layout.Horizontal
             auto_dimension = Style.Width.Auto
 
-        if getattr(self, '_available_{}'.format(main)) is not None:
-            return getattr(self, '_available_{}'.format(main))
+        if self.style.border_collapse:
+            adjustment = 0
+            small_adjustment = 0
+        else:
+            adjustment = 2
+            small_adjustment = 1
+        inside_main = available - adjustment
+        if self.style.layout == divided_dimension:
+            inside_main -= sum([
+                getattr(child.style, main)
+                for child in self.children
+                if type(getattr(child.style, main)) == int
+            ])
+            auto_children = len([
+                child
+                for child in self.children
+                if getattr(child.style, main) == auto_dimension
+            ])
+
+        result = []
+        for child in self.children:
+            if getattr(child, '_available_{}'.format(main)) is not None:
+                result.append(getattr(child, '_available_{}'.format(main)))
+            elif type(getattr(child.style, main)) == int:
+                result.append(getattr(child.style, main))
+            elif self.style.layout == full_dimension:
+                result.append(inside_main)
+            elif self.style.layout == divided_dimension:
+                # A child sized by its own children only needs this if one
+                # of them is Auto; with no Auto siblings to share with, it
+                # may have all that is left.
+                result.append(
+                    floor(inside_main / max(auto_children, 1) + 1)
+                    - small_adjustment
+                )
+            else:
+                result.append(2)
+        return result
+
+    def __dimension(self, main, available, child_sizes):
+        if main == "height":
+            auto_dimension = Style.Height.Auto
+        else:
+            auto_dimension = Style.Width.Auto
+
+        if getattr(self.style, main) == auto_dimension:
+            return available
         if type(getattr(self.style, main)) == int:
             return getattr(self.style, main)
-        if self.parent is not None:
-            if self.parent.style.border_collapse:
-                adjustment = 0
-                small_adjustment = 0
-            else:
-                adjustment = 2
-                small_adjustment = 1
-            inside_main = (
-                getattr(self.parent, 'available_{}'.format(main)) - adjustment
+
+        if self.parent and self.parent.style.border_collapse:
+            adjustment = 0
+        else:
+            adjustment = 2
+        required_main = sum(child_sizes) + adjustment
+        return max(required_main, getattr(self.style, "min_{}".format(main)))
+
+    def _measure(self, sizes, available_width, available_height):
+        """
+        Work out the available and actual dimensions of this box and its
+        descendants, top-down for the available space and bottom-up for the
+        sizes, storing them in `sizes`.
+        """
+
+        child_sizes = [
+            child._measure(sizes, child_width, child_height)
+            for child, child_width, child_height in zip(
+                self.children,
+                self._children_available("width", available_width),
+                self._children_available("height", available_height),
             )
-            if self.parent.style.layout == full_dimension:
-                return inside_main
-            if self.parent.style.layout == divided_dimension:
-                inside_main -= sum([
-                    getattr(sib.style, main)
-                    for sib in self.siblings_including_self
-                    if type(getattr(sib.style, main)) == int
-                ])
-                auto_sibs = [
-                    sib
-                    for sib in self.siblings_including_self
-                    if getattr(sib.style, main) == auto_dimension
-                ]
-                return (
-                    floor(inside_main / len(auto_sibs) + 1) - small_adjustment
-                )
-        return 2
+        ]
+        width = self.__dimension(
+            "width",
+            available_width,
+            [w for w, _ in child_sizes],
+        )
+        height = self.__dimension(
+            "height",
+            available_height,
+            [h for _, h in child_sizes],
+        )
+        sizes[self] = (width, height, available_width, available_height)
+        self._layout_dirty = False
+        return width, height
+
+    def _place(self, table, sizes, upper_left):
+        """
+        Position this box at `upper_left` and its descendants relative to it,
+        filling in `table`.
+        """
+
+        x, y = upper_left
+        width, height, available_width, available_height = sizes[self]
+        table[self] = Geometry(
+            x,
+            y,
+            width,
+            height,
+            available_width,
+            available_height,
+        )
+
+        if self.style.border_collapse:
+            adjustment = 0
+        else:
+            adjustment = 1
+        elder_x, elder_y = x, y
+        for i, child in enumerate(self.children):
+            if self.style.layout == Style.Layout.Horizontal:
+                point = Point(elder_x + adjustment - bool(i), y + adjustment)
+            else:
+                point = Point(x + adjustment, elder_y + adjustment - bool(i))
+            child._place(table, sizes, point)
+            child_width, child_height = sizes[child][:2]
+            elder_x, elder_y = point.x + child_width, point.y + child_height
 
     @property
     def available_height(self):
@@ -260,11 +548,13 @@ class Box(object):
             `border_collapse` setting.
         """
 
-        return self.__available_dimension("height")
+        return self._geometry.available_height
 
     @available_height.setter
     def available_height(self, val):
-        self._available_height = val
+        if val != self._available_height:
+            self._available_height = val
+            self.invalidate_layout()
 
     @property
     def available_width(self):
@@ -276,34 +566,13 @@ class Box(object):
             `border_collapse` setting.
         """
 
-        return self.__available_dimension("width")
+        return self._geometry.available_width
 
     @available_width.setter
     def available_width(self, val):
-        self._available_width = val
-
-    def __dimension(self, main):
-        if main == "height":
-            auto_dimension = Style.Height.Auto
-        else:
-            auto_dimension = Style.Width.Auto
-
-        if not self.children:
-            required_main = 2
-
-        if self.parent and self.parent.style.border_collapse:
-            adjustment = 0
-        else:
-            adjustment = 2
-
-        required_main = (
-            sum(getattr(c, main) for c in self.children) + adjustment
-        )
-        if getattr(self.style, main) == auto_dimension:
-            return getattr(self, "available_{}".format(main))
-        if type(getattr(self.style, main)) == int:
-            return getattr(self.style, main)
-        return max(required_main, getattr(self.style, "min_{}".format(main)))
+        if val != self._available_width:
+            self._available_width = val
+            self.invalidate_layout()
 
     @property
     def height(self):
@@ -314,7 +583,7 @@ class Box(object):
             Actual number of rows in the box, including any border.
         """
 
-        return self.__dimension("height")
+        return self._geometry.height
 
     @property
     def inner_height(self):
@@ -336,7 +605,7 @@ class Box(object):
             Actual number of columns in the box, including any border.
         """
 
-        return self.__dimension("width")
+        return self._geometry.width
 
     @property
     def inner_width(self):
@@ -358,34 +627,8 @@ class Box(object):
             The location of the upper left corner of the box, when rendered.
         """
 
-        if self.parent is not None:
-            x, y = self.parent.upper_left
-            layout = self.parent.style.layout
-        else:
-            x, y = -1, -1
-            layout = Style.layout
-
-        if self.older_siblings:
-            elder_x, elder_y = self.older_siblings[-1].lower_right
-        else:
-            elder_x, elder_y = x, y
-
-        if self.parent and self.parent.style.border_collapse:
-            adjustment = 0
-        else:
-            adjustment = 1
-
-        if layout == Style.Layout.Horizontal:
-            point = Point(
-                elder_x + adjustment - bool(self.older_siblings),
-                y + adjustment,
-            )
-        else:
-            point = Point(
-                x + adjustment,
-                elder_y + adjustment - bool(self.older_siblings),
-            )
-        return point
+        geometry = self._geometry
+        return Point(geometry.x, geometry.y)
 
     @property
     def lower_right(self):
@@ -396,10 +639,10 @@ class Box(object):
             The location of the lower right corner of the box, when rendered.
         """
 
-        x, y = self.upper_left
+        geometry = self._geometry
         return Point(
-            x + self.width,
-            y + self.height,
+            geometry.x + geometry.width,
+            geometry.y + geometry.height,
         )
 
     @property
@@ -409,14 +652,79 @@ class Box(object):
         -------
         str
             The inner text of the box. This may change if the box is editable.
+
+            It is kept in a :py:class:`.Rope`, and only turned into a string
+            when read after a change. To add to the end of a long text, use
+            :py:meth:`append_text` rather than ``box.text += ...``, which
+            copies the whole text each time.
         """
 
+        if self._text is None and self._buffer is not None:
+            self._text = str(self._buffer)
         return self._text
 
     @text.setter
     def text(self, val):
-        self._text = val
-        self.root.dirty = True
+        self._buffer = None if val is None else self._new_buffer(val)
+        # A ring may not have kept all of it.
+        self._text = val if isinstance(self._buffer, Rope) else None
+        self.damage()
+
+    @property
+    def buffer(self):
+        """
+        Returns
+        -------
+        :py:class:`.Rope`, :py:class:`.LineRing` or None
+            The storage behind :py:attr:`text`, for reading lines of it
+            without making a string of the whole thing. It is a
+            :py:class:`.LineRing` if `max_lines` or `max_bytes` was given.
+        """
+
+        return self._buffer
+
+    def _new_buffer(self, text=""):
+        if self.max_lines is None and self.max_bytes is None:
+            return Rope(text)
+        return LineRing(
+            text,
+            max_lines=self.max_lines,
+            max_bytes=self.max_bytes,
+        )
+
+    def append_text(self, text):
+        """
+        Add text to the end of the box's text, without copying what is
+        already there.
+
+        Arguments
+        ---------
+        text : str
+            The text to add.
+        """
+
+        if self._buffer is None:
+            self._buffer = self._new_buffer()
+        evicted = self._buffer.append(text)
+        if evicted:
+            # Keep showing the same lines, as far as they are still kept.
+            self._text_offset = max(0, self._text_offset - evicted)
+        self._text = None
+        self.damage()
+
+    @property
+    def line_count(self):
+        """
+        Returns
+        -------
+        int
+            The number of newlines in the box's text. The rope behind the text
+            keeps count as it is edited, so this does not scan the text.
+        """
+
+        if self._buffer is None:
+            return 0
+        return self._buffer.line_count
 
     def scroll(self, amount=1):
         """
@@ -427,11 +735,155 @@ class Box(object):
         amount : int
             Number of rows to shift by. Defaults: `1`.
         """
-        num_lines = self.text.count("\n")
-        self._text_offset += amount
+        self.scroll_to(self._text_offset + amount)
+
+    def scroll_to(self, line):
+        """
+        Move the visible contents of the box so that `line` is at the top.
+
+        Arguments
+        ---------
+        line : int
+            The row to show first, counting from zero.
+        """
+        num_lines = self.line_count
+        self._text_offset = min(num_lines - 1, line)
+        # Clamped from below last, so that a box with no lines yet (such as
+        # a file still being indexed) stays at the top rather than at -1.
         self._text_offset = max(0, self._text_offset)
-        self._text_offset = min(num_lines - 1, self._text_offset)
-        self.root.dirty = True
+        self.damage(contents=False)
+
+    def mount(self, app):
+        """
+        Called when an application first shows the box. Subclasses can use
+        this to start any work they need the application for.
+
+        Arguments
+        ---------
+        app : :py:class:`.Application`
+            The application showing the box.
+        """
+
+    def unmount(self, app):
+        """
+        Called when an application stops showing the box, because it has
+        left the layout. Subclasses can use this to free what
+        :py:meth:`mount` took up. The box may be mounted again later.
+
+        Arguments
+        ---------
+        app : :py:class:`.Application`
+            The application that was showing the box.
+        """
+
+    def damage(self, contents=True):
+        """
+        Add this box to the damage set of the application it is shown in, if
+        any, so that it is drawn again.
+
+        Keyword Arguments
+        -----------------
+        contents : bool
+            Whether the contents of the box have changed, as opposed to only
+            which part of them is visible. Default: `True`.
+        """
+
+        if contents:
+            self.dirty = True
+        application = self.root.application
+        if application is not None:
+            application.damage(self)
+
+
+Window = namedtuple('Window', 'box win pad textbox')
+
+
+def _overlaps(rect, other):
+    # Rects are (lines, columns, y, x), as windows are made.
+    lines, columns, y, x = rect
+    other_lines, other_columns, other_y, other_x = other
+    return (
+        y < other_y + other_lines and other_y < y + lines
+        and x < other_x + other_columns and other_x < x + columns
+    )
+
+
+def _task_key(coro_func):
+    if isinstance(coro_func, partial):
+        return (
+            _task_key(coro_func.func),
+            coro_func.args,
+            tuple(sorted((coro_func.keywords or {}).items())),
+        )
+    return coro_func
+
+
+class FocusManager(object):
+    """
+    Keeps track of which box has focus, and which textbox, if any, is being
+    edited in it.
+
+    Changing focus triggers the application's `blur` event for the box that
+    lost it, then its `focus` event for the box that gained it. Handlers are
+    passed the box as `box`::
+
+        @app.on('focus')
+        def highlight(app, box):
+            box.title = '* ' + box.title
+
+    Arguments
+    ---------
+    application : :py:class:`.Application`
+    """
+
+    def __init__(self, application):
+        self.application = application
+        self.box = None
+        self.textbox = None
+
+    def set(self, box, textbox=None):
+        """
+        Give a box focus.
+
+        Arguments
+        ---------
+        box : :py:class:`.Box` or None
+            The box to focus, or None to leave nothing focused.
+
+        Keyword Arguments
+        -----------------
+        textbox : :py:class:`.AsyncTextbox`
+            The textbox editing the box, if any.
+        """
+
+        previous, self.box, self.textbox = self.box, box, textbox
+        if box is previous:
+            return
+        if previous is not None:
+            self.application.trigger('blur', box=previous)
+        if box is not None:
+            self.application.trigger('focus', box=box)
+
+    def clear(self):
+        """
+        Leave nothing focused.
+        """
+
+        self.set(None)
+
+    @property
+    def active_textbox(self):
+        """
+        Returns
+        -------
+        :py:class:`.AsyncTextbox` or None
+            The textbox of the focused box, if it is being edited.
+        """
+
+        textbox = self.textbox
+        if textbox is not None and textbox.is_active:
+            return textbox
+        return None
 
 
 class Application(object):
@@ -441,16 +893,63 @@ class Application(object):
     Keyword Arguments
     -----------------
     root : :py:class:`.Box`
+    max_fps : int
+        The most frames to draw in a second. Damage done in between frames is
+        drawn together in the next one. Default: `30`.
+    key_timeout : float
+        How many seconds to wait for the next key of a sequence, when the
+        keys typed so far are bound themselves but also start a longer
+        sequence. Default: `1`.
     """
 
-    def __init__(self, root=None):
+    #: The number of rows of text kept in a box's pad above and below the
+    #: visible ones, so that short scrolls need not write the pad again.
+    overscan = 10
+
+    #: Whether to ask the terminal to mark pasted text, so that a paste into
+    #: an editable box is inserted in one go.
+    bracketed_paste = True
+
+    #: The names of the events that are not keys, and so are bound in the
+    #: registry that :py:meth:`trigger` runs, rather than to keys. Extend it
+    #: to bind events of your own.
+    events = frozenset(('ready', 'focus', 'blur'))
+
+    def __init__(self, root=None, max_fps=30, key_timeout=1):
         self.stdscr = curses.initscr()
         self._registry = defaultdict(list)
+        self._window_pool = {}
+        self._window_rects = {}
+        self._window_order = {}
+        self.damaged = set()
+        self.windows = []
+        self.max_fps = max_fps
+        self.key_batch = []
+        self.key_timeout = key_timeout
+        self.keymap = KeyMap()
+        self._keymaps = {}
+        self._sequencer = KeySequencer()
+        self._coalesced = OrderedDict()
+        self.coalesced_keys = 0
+        self._key_timer = None
+        self._paste = PasteParser()
+        self.focus = FocusManager(self)
+        self.wrap_cache = WrapCache()
+        self._flowed = {}
+        self._pad_starts = {}
+        self.sources = []
+        self.coalesced_frames = 0
+        self._scheduled = {}
+        self.coalesced_tasks = 0
+        self._frame_handle = None
+        self._drawing_frame = False
+        self._last_frame = None
         self.root = root
         self.loop = asyncio.get_event_loop()
+        self.scheduler = Scheduler(self.loop)
         if root is not None:
+            self.root.application = self
             self.recalculate_windows()
-            self.root.dirty = True
 
     def __enter__(self):
         logging.basicConfig(
@@ -462,6 +961,9 @@ class Application(object):
         curses.cbreak()
         self.stdscr.keypad(1)
         self.stdscr.nodelay(1)
+        if self.bracketed_paste:
+            sys.stdout.write(PASTE_ON)
+            sys.stdout.flush()
         try:
             curses.curs_set(0)
         except:
@@ -470,6 +972,11 @@ class Application(object):
         return self
 
     def __exit__(self, *args):
+        if self.bracketed_paste:
+            sys.stdout.write(PASTE_OFF)
+            sys.stdout.flush()
+        if not self.loop.is_closed():
+            self.loop.remove_reader(sys.stdin.fileno())
         self.loop.close()
         curses.nocbreak()
         self.stdscr.keypad(0)
@@ -478,48 +985,99 @@ class Application(object):
 
     def add_window(self, box):
         """
-        Draw a box onto the screen.
+        Place a box's window on the screen.
+
+        The box's window and pad are created the first time it is placed, and
+        reused after that; they are only moved or resized when the box's
+        geometry has changed. Either way, the box is marked as damaged so
+        that its contents are drawn on the next frame.
 
         Arguments
         ---------
         box : :py:class:`.Box`
-            The box to draw.
+            The box to place.
         """
 
-        win_x, win_y = self.get_window_size()
         x, y = box.upper_left
-
         if box.parent is not None:
             columns = box.width
             lines = box.height
         else:
-            columns = win_x
-            lines = win_y
-
-        win = curses.newwin(lines, columns, y, x)
-        pad = curses.newpad(box.inner_width, 1000)
-        win.border()
-
-        if box.title:
-            win.addstr(0, 1, box.title)
-
-        if box.text:
-            if box.style.flow:
-                text = wrap_by_paragraph(box.text, width=box.inner_width)
+            columns, lines = self.get_window_size()
+        rect = (lines, columns, y, x)
+
+        window = self._window_pool.get(box)
+        if window is None:
+            win = curses.newwin(lines, columns, y, x)
+            pad = curses.newpad(*self._pad_size(box))
+            if box.editable:
+                # We want to attach the textbox to the pad, not the window,
+                # because the window has a border, and that means we capture
+                # the box-drawing characters, and write on the border. UGLY.
+                textbox = AsyncTextbox(pad, box, self)
             else:
-                text = box.text
-            pad.addstr(0, 0, text)
+                textbox = None
+            window = Window(box, win, pad, textbox)
+            box.mount(self)
+        elif self._window_rects[box] != rect:
+            window = self._reshape_window(window, rect)
+
+        if self._window_rects.get(box) != rect:
+            window.win.erase()
+            box.damage()
+        self._window_pool[box] = window
+        self._window_rects[box] = rect
+
+    def _reshape_window(self, window, rect):
+        lines, columns, y, x = rect
+        try:
+            window.win.resize(lines, columns)
+            window.win.mvwin(y, x)
+        except curses.error:
+            # Moving first or resizing first can each push the window off the
+            # screen part way through; start afresh instead.
+            window = window._replace(win=curses.newwin(lines, columns, y, x))
+        pad_size = self._pad_size(window.box)
+        if window.pad.getmaxyx() != pad_size:
+            window.pad.resize(*pad_size)
+            if window.textbox is not None:
+                window.textbox.maxy = pad_size[0] - 1
+                window.textbox.maxx = pad_size[1] - 1
+        return window
+
+    def _pad_size(self, box):
+        """
+        A pad holds only the visible rows of a box's text, and the overscan
+        either side of them.
+        """
 
+        lines = max(1, box.inner_height) + 2 * self.overscan
         if box.editable:
-            # We want to attach the textbox to the pad, not the window, because
-            # the window has a border, and that means we capture the
-            # box-drawing characters, and write on the border. UGLY.
-            textbox = AsyncTextbox(pad, box, self)
-        else:
-            textbox = None
+            # The textbox moves along the pad as characters are typed, so
+            # leave it room to do so.
+            return lines, 1000
+        return lines, max(1, box.inner_width)
 
-        # This should probably be a namedtuple
-        self.windows.append((box, win, pad, textbox))
+    def remove_window(self, box):
+        """
+        Forget the window, pad and key bindings of a box that has left the
+        layout.
+
+        Arguments
+        ---------
+        box : :py:class:`.Box`
+            The box to stop drawing.
+        """
+
+        if self._window_pool.pop(box, None) is not None:
+            box.unmount(self)
+        self._window_rects.pop(box, None)
+        self._flowed.pop(box, None)
+        self._pad_starts.pop(box, None)
+        self._keymaps.pop(box, None)
+        self.damaged.discard(box)
+        if self.focus.box is box:
+            self.focus.clear()
 
     def add_windows(self, *boxes):
         """
@@ -534,6 +1092,51 @@ class Application(object):
         for box in boxes:
             self.add_window(box)
 
+    def attach(self, box, stream, max_pending=10000):
+        """
+        Pump lines from a stream into a box.
+
+        The lines read between frames are added to the box together, at the
+        start of the next frame, rather than one at a time. If the box falls
+        `max_pending` lines behind, reading stops until the next frame.
+
+        Arguments
+        ---------
+        box : :py:class:`.Box`
+            The box to add lines to.
+        stream : asyncio.StreamReader, subprocess or async iterator
+            Where to read lines from. For an
+            :py:class:`asyncio.subprocess.Process`, its standard output is
+            read.
+
+        Keyword Arguments
+        -----------------
+        max_pending : int
+            The most lines to hold between frames. Default: `10000`.
+
+        Returns
+        -------
+        :py:class:`.StreamSource`
+        """
+
+        source = StreamSource(box, stream, max_pending=max_pending)
+        self.sources.append(source)
+        self.schedule(source.pump)
+        return source
+
+    def flush_sources(self):
+        """
+        Add the lines waiting in every attached source to their boxes, and
+        forget the sources whose streams have ended.
+        """
+
+        for source in self.sources:
+            source.flush()
+        self.sources = [
+            source for source in self.sources
+            if not source.finished
+        ]
+
     def edit(self, box, callback=None):
         """
         Update the text contents of a particular box.
@@ -549,8 +1152,8 @@ class Application(object):
             The continuation to run after processing the edit.
         """
         try:
-            textbox = list(filter(lambda x: x[0] == box, self.windows))[0][3]
-        except IndexError:
+            textbox = self._window_pool[box].textbox
+        except KeyError:
             return None
         self.log('editing')
         textbox.edit(callback=callback)
@@ -564,6 +1167,18 @@ class Application(object):
         y, x = self.stdscr.getmaxyx()
         return Point(x, y)
 
+    @property
+    def active_textbox(self):
+        """
+        Returns
+        -------
+        :py:class:`.AsyncTextbox` or None
+            The textbox being edited, which keys are sent to instead of
+            the handlers registered with :py:meth:`on`.
+        """
+
+        return self.focus.active_textbox
+
     @property
     def has_active_textbox(self):
         """
@@ -572,10 +1187,7 @@ class Application(object):
         bool
             Whether any box in the layout is editable and is currently active.
         """
-        return any(
-            getattr(textbox, 'is_active', False)
-            for _, _, _, textbox in self.windows
-        )
+        return self.active_textbox is not None
 
     def log(self, *args):
         """
@@ -590,7 +1202,7 @@ class Application(object):
         msg = " ".join(map(str, args))
         logging.info(msg)
 
-    def on(self, event, func=None):
+    def on(self, event, func=None, box=None, coalesce=False):
         """
         Bind a callback to an event.
 
@@ -605,25 +1217,64 @@ class Application(object):
         As a decorator::
 
             @app.on('j')
-            def scroll_down(app):
-                ls_box.scroll(1)
+            def scroll_down(app, count=1):
+                ls_box.scroll(count)
+
+        Keys can be bound in sequences, such as ``'g g'`` or ``'C-x C-s'``,
+        and typed after a count, as in ``10j``. A handler that takes a
+        `count` argument is passed the count and run once; any other is run
+        that many times.
+
+        All the keys waiting when the terminal wakes the application up are
+        read at once, and their handlers scheduled together. `key_batch`
+        holds the latest such batch of keys. It is only a hint: the handlers
+        run later, by which time another batch may have replaced theirs. A
+        handler that needs to know how many times its keys were typed should
+        be bound with `coalesce`, and take a `count`.
 
         Arguments
         ---------
         event : str
-            Either the event name to bind to, or a single character to listen
-            for.
+            Either the event name to bind to, or the keys to listen for, as
+            understood by :py:func:`.parse_keys`. The events are `ready`,
+            once the application starts, and `focus` and `blur`, as described
+            in :py:class:`.FocusManager`.
 
         Keyword Arguments
         -----------------
         func : function in (self: :py:class:`.Application`)
             The function to call on the bound event.
+        box : :py:class:`.Box`
+            Only listen for the keys while this box, or a box inside it, has
+            focus. Its bindings win over those of the boxes around it, and
+            over those made without a box. Events that are not keys cannot
+            be bound to a box; `focus` and `blur` handlers are passed the box
+            instead.
+        coalesce : bool
+            Gather up the times the keys are typed before the next frame, and
+            run the handler once for all of them, with their counts added up,
+            just before the frame is drawn. Holding down a key bound this way
+            costs one call and one frame per frame, rather than a task per
+            key. The keys folded into an earlier one are counted in
+            `coalesced_keys`. Default: `False`.
         """
 
+        if event in self.events and box is not None:
+            raise ValueError(
+                "Only keys can be bound to a box, not {!r}".format(event)
+            )
+
         def decorator(fn):
             if not asyncio.iscoroutinefunction(fn):
                 fn = asyncio.coroutine(fn)
-            self._register(event, fn)
+            if event in self.events:
+                self._register(event, fn)
+            else:
+                keymap = self.keymap
+                if box is not None:
+                    keymap = self._keymaps.setdefault(box, KeyMap())
+                keymap.bind(event, fn, coalesce=coalesce)
+                self.log("Run {} on keys {}".format(fn.__name__, event))
             return fn
         if func is None:
             return decorator
@@ -632,13 +1283,259 @@ class Application(object):
     def recalculate_windows(self):
         """
         Redraw on window changes.
+
+        Only boxes whose geometry changed have their windows placed again.
+        Windows belonging to boxes that are no longer in the layout are
+        freed.
         """
 
-        self.windows = []
         x, y = self.get_window_size()
         self.root.available_height = y
         self.root.available_width = x
-        self.add_windows(*self.root.traverse_pre_order)
+        changed = self.root.layout()
+        if not changed:
+            return
+        boxes = self.root.traverse_pre_order
+        for box in set(self._window_pool).difference(boxes):
+            self.remove_window(box)
+        self._window_order = {box: i for i, box in enumerate(boxes)}
+        self.add_windows(*(
+            box for box in boxes
+            if box in changed or box not in self._window_pool
+        ))
+        self.windows = [self._window_pool[box] for box in boxes]
+
+    def repaint_windows(self):
+        """
+        Draw the contents of every damaged box, and clear the damage set.
+
+        A box's pad covers its children, so redrawing a box means its
+        descendants have to be copied to the screen again too, after it.
+        Where borders collapse, a box's window also shares its edges with
+        boxes drawn after it, so once it is written to the screen again so
+        are they, lest its corners show over theirs.
+
+        Returns
+        -------
+        list of :py:class:`.Window`
+            The windows to refresh this frame, in drawing order.
+        """
+
+        damaged = {box for box in self.damaged if box in self._window_order}
+        self.damaged = set()
+        if not damaged:
+            return []
+
+        windows = []
+        staged = set()
+        # The rects of the windows written to the screen whole this frame.
+        written = []
+        start = min(self._window_order[box] for box in damaged)
+        for window in self.windows[start:]:
+            box = window.box
+            rect = self._window_rects[box]
+            exposed = box.parent in staged or any(
+                _overlaps(rect, other) for other in written
+            )
+            if box not in damaged and not exposed:
+                continue
+            if box.dirty:
+                window.win.border()
+                if box.title:
+                    window.win.addstr(0, 1, box.title)
+                self._fill_pad(window)
+                box.dirty = False
+                written.append(rect)
+            elif not self._pad_covers(window):
+                self._fill_pad(window)
+            else:
+                # Scrolled within the overscan: the pad already holds the
+                # rows, they just need copying to the screen from elsewhere.
+                window.pad.touchwin()
+            if exposed:
+                window.win.touchwin()
+                window.pad.touchwin()
+                written.append(rect)
+            staged.add(box)
+            windows.append(window)
+        return windows
+
+    def _fill_pad(self, window):
+        """
+        Write the visible rows of a box's text, and the overscan around them,
+        into its pad. Only those rows are taken from the text, so this costs
+        the same however long the text is, unless the box's style flows its
+        text.
+        """
+
+        box = window.box
+        lines, columns = window.pad.getmaxyx()
+        start = max(0, box._text_offset - self.overscan)
+        if window.textbox is not None and window.textbox.is_active:
+            rows = window.textbox.characters.split('\n')[start:start + lines]
+        elif box.style.flow:
+            rows = self._flow_lines(box)[start:start + lines]
+        elif box.buffer is not None:
+            rows = box.buffer.lines(start, start + lines)
+        else:
+            rows = []
+        window.pad.erase()
+        for i, row in enumerate(rows):
+            try:
+                window.pad.addnstr(i, 0, row, columns)
+            except curses.error:
+                # Writing the bottom right cell moves the cursor off the end
+                # of the pad, which curses reports as an error.
+                pass
+        self._pad_starts[box] = start
+
+    def _pad_covers(self, window):
+        box = window.box
+        start = self._pad_starts.get(box)
+        if start is None:
+            return False
+        lines, _ = window.pad.getmaxyx()
+        offset = max(0, box._text_offset)
+        return start <= offset and offset + box.inner_height <= start + lines
+
+    def _flow_lines(self, box):
+        # Unlike the other buffers, this reads the whole text: which wrapped
+        # row a paragraph starts on depends on every paragraph before it.
+        # Paragraphs that have not changed come out of the wrap cache.
+        text, width, lines = self._flowed.get(box, (None, None, None))
+        # Box.text hands back the same string until the text is changed.
+        if text is not box.text or width != box.inner_width:
+            text, width = box.text, box.inner_width
+            if text:
+                lines = wrap_by_paragraph(
+                    text,
+                    width=width,
+                    cache=self.wrap_cache,
+                ).split('\n')
+            else:
+                lines = []
+            self._flowed[box] = (text, width, lines)
+        return lines
+
+    def commit_frame(self, windows):
+        """
+        Put a frame on the terminal in one physical update.
+
+        Every window and pad is staged with ``noutrefresh``, and the terminal
+        is written once, by ``curses.doupdate``, at the end.
+
+        Arguments
+        ---------
+        windows : list of :py:class:`.Window`
+            The windows to show, in drawing order.
+        """
+
+        self.stdscr.noutrefresh()
+        for box, win, pad, textbox in windows:
+            win.noutrefresh()
+            x, y = box.upper_left
+            dx, dy = box.lower_right
+            row = max(0, box._text_offset) - self._pad_starts.get(box, 0)
+            pad.noutrefresh(row, 0, y + 1, x + 1, dy - 2, dx - 2)
+        curses.doupdate()
+
+    def damage(self, *boxes):
+        """
+        Add boxes to the damage set, and ask for a frame to draw them in.
+
+        Arguments
+        ---------
+        boxes : :py:class:`.Box`
+            The boxes whose contents need drawing again.
+        """
+
+        self.damaged.update(boxes)
+        self.request_render()
+
+    def request_render(self):
+        """
+        Ask for a frame to be drawn.
+
+        The frame is drawn as soon as possible, but no sooner than
+        ``1 / max_fps`` seconds after the previous one. Requests made while a
+        frame is already waiting are folded into it, and counted in
+        `coalesced_frames`.
+        """
+
+        if self._drawing_frame:
+            return
+        if self._frame_handle is not None:
+            self.coalesced_frames += 1
+            return
+        if self._last_frame is None:
+            delay = 0
+        else:
+            delay = max(
+                0,
+                self._last_frame + 1 / self.max_fps - self.loop.time(),
+            )
+        self._frame_handle = self.loop.call_later(
+            delay,
+            partial(self.schedule, render, priority=RENDER),
+        )
+
+    def start_frame(self):
+        """
+        Called by :py:func:`.render` before it draws. Damage done from here
+        until :py:meth:`finish_frame` is drawn in the current frame, so it
+        does not ask for another.
+        """
+
+        self._frame_handle = None
+        self._drawing_frame = True
+        self._last_frame = self.loop.time()
+
+    def finish_frame(self):
+        """
+        Called by :py:func:`.render` once it has drawn.
+        """
+
+        self._drawing_frame = False
+        if self._coalesced:
+            # Keys came in while a handler was waiting mid-frame.
+            self.request_render()
+
+    @asyncio.coroutine
+    def run_coalesced(self):
+        """
+        Run the handlers bound with ``coalesce=True`` whose keys were typed
+        since the last frame, once each. Called by :py:func:`.render` before
+        it draws. A handler that raises is reported to the loop's exception
+        handler, and does not stop the others or the frame.
+        """
+
+        coalesced, self._coalesced = self._coalesced, OrderedDict()
+        for binding, count in coalesced.items():
+            if binding.takes_count:
+                calls = [partial(binding.handler, count=count)]
+            else:
+                calls = [binding.handler] * count
+            for call in calls:
+                try:
+                    yield from call(self)
+                except Exception as exc:
+                    # Report it as the loop would for a task of its own, and
+                    # carry on with the rest of the frame.
+                    self.loop.call_exception_handler({
+                        'message': 'Exception in coalesced key handler',
+                        'exception': exc,
+                    })
+
+    @property
+    def needs_render(self):
+        """
+        Returns
+        -------
+        bool
+            Whether any box is damaged or waiting to be laid out again.
+        """
+
+        return bool(self.damaged or self.root._layout_pending)
 
     def _register(self, event_id, fn):
         self._registry[event_id].append(fn)
@@ -649,16 +1546,17 @@ class Application(object):
         Start the application loop and trigger the `ready` event.
         """
 
-        self.loop.call_soon(self._process_key)
-        self.schedule(render)
-        for handler in self._registry['ready']:
-            self.schedule(handler)
+        # Keys are read as soon as the terminal has bytes for us, rather than
+        # by polling.
+        self.loop.add_reader(sys.stdin.fileno(), self._process_key)
+        self.request_render()
+        self.trigger('ready')
         try:
             self.loop.run_forever()
         except:
             self.loop.close()
 
-    def schedule(self, coro_func):
+    def schedule(self, coro_func, key=None, priority=BACKGROUND):
         """
         Add a function to the application to do later.
 
@@ -666,19 +1564,149 @@ class Application(object):
         ---------
         coro_func : function in (self: :py:class:`.Application`)
             The function to add to the execution loop.
+
+        Keyword Arguments
+        -----------------
+        key : hashable or True
+            If given, the function is not scheduled while another with the
+            same key is still waiting to start; it is dropped, and counted in
+            `coalesced_tasks`. Once that one starts, the key is free again,
+            so nothing scheduled after it is missed. Pass True to use the
+            function itself as the key, along with its arguments if it is a
+            :py:func:`functools.partial`.
+        priority : int
+            When to start the function, relative to others waiting, as
+            described in :py:class:`.Scheduler`. Key handlers are started at
+            :py:data:`.INPUT` priority, and frames at :py:data:`.RENDER`.
+            Default: :py:data:`.BACKGROUND`.
+
+        Returns
+        -------
+        asyncio.Future
+            The outcome of the function, or, if it was dropped, of the one
+            waiting with the same key.
+        """
+
+        if key is None:
+            return self.scheduler.submit(coro_func(self), priority)
+        if key is True:
+            key = _task_key(coro_func)
+        try:
+            future = self._scheduled.get(key)
+        except TypeError:
+            # Arguments that cannot be hashed cannot be compared either.
+            return self.scheduler.submit(coro_func(self), priority)
+        if future is not None:
+            self.coalesced_tasks += 1
+            return future
+        future = self.scheduler.submit(
+            self._run_keyed(key, coro_func),
+            priority,
+        )
+        self._scheduled[key] = future
+
+        def cancelled(future):
+            # Cancelled before it started.
+            if self._scheduled.get(key) is future:
+                del self._scheduled[key]
+
+        future.add_done_callback(cancelled)
+        return future
+
+    @asyncio.coroutine
+    def _run_keyed(self, key, coro_func):
+        self._scheduled.pop(key, None)
+        return (yield from coro_func(self))
+
+    def trigger(self, event, **kwargs):
         """
+        Schedule the handlers bound to an event.
+
+        Arguments
+        ---------
+        event : str
+            The event name, from :py:attr:`events`.
 
-        self.loop.create_task(coro_func(self))
+        Keyword Arguments
+        -----------------
+        Any keyword arguments are passed on to the handlers.
+        """
+
+        for handler in self._registry[event]:
+            if kwargs:
+                handler = partial(handler, **kwargs)
+            self.schedule(handler)
 
     def _process_key(self):
-        try:
-            if self.has_active_textbox:
-                pass
+        codes = []
+        while True:
+            ch = self.stdscr.getch()
+            if ch == -1:
+                break
+            codes.append(ch)
+        keys = []
+        for event in self._paste.feed(codes):
+            # Editing may stop part way through the keys read.
+            textbox = self.active_textbox
+            if isinstance(event, str):
+                if textbox is not None:
+                    textbox.paste(event)
+                else:
+                    keys.extend(event)
+            elif textbox is not None:
+                textbox.process_key(event)
             else:
-                key = self.stdscr.getkey()
-                for handler in self._registry[key]:
-                    self.schedule(handler)
-        except curses.error:
-            pass
-        finally:
-            self.loop.call_later(0.1, self._process_key)
+                keys.append(self._key_name(event))
+        if not keys:
+            return
+        self.key_batch = keys
+        if self._key_timer is not None:
+            self._key_timer.cancel()
+            self._key_timer = None
+        keymaps = self._keymaps_in_focus()
+        for key in keys:
+            self._run_bindings(self._sequencer.feed(key, keymaps))
+        if self._sequencer.pending:
+            self._key_timer = self.loop.call_later(
+                self.key_timeout,
+                self._key_timed_out,
+            )
+
+    def _keymaps_in_focus(self):
+        keymaps = []
+        box = self.focus.box
+        while box is not None:
+            if box in self._keymaps:
+                keymaps.append(self._keymaps[box])
+            box = box.parent
+        keymaps.append(self.keymap)
+        return keymaps
+
+    def _key_timed_out(self):
+        self._key_timer = None
+        self._run_bindings(self._sequencer.timeout())
+
+    def _run_bindings(self, bindings):
+        for binding, count in bindings:
+            if binding.coalesce:
+                if binding in self._coalesced:
+                    self.coalesced_keys += count
+                self._coalesced[binding] = (
+                    self._coalesced.get(binding, 0) + count
+                )
+                self.request_render()
+            elif binding.takes_count:
+                self.schedule(
+                    partial(binding.handler, count=count),
+                    priority=INPUT,
+                )
+            else:
+                for _ in range(count):
+                    self.schedule(binding.handler, priority=INPUT)
+
+    @staticmethod
+    def _key_name(ch):
+        # The name getkey would have given.
+        if ch < 256:
+            return chr(ch)
+        return curses.keyname(ch).decode()
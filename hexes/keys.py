@@ -0,0 +1,297 @@
+"""
+This module contains the helpers for reading keys:
+
+* :py:class:`.PasteParser`
+* :py:class:`.KeyMap`
+* :py:class:`.KeySequencer`
+"""
+
+import inspect
+from collections import namedtuple
+
+__all__ = (
+    'Binding',
+    'KeyMap',
+    'KeySequencer',
+    'PASTE_OFF',
+    'PASTE_ON',
+    'PasteParser',
+    'parse_keys',
+)
+
+#: Asks the terminal to mark pasted text.
+PASTE_ON = '\x1b[?2004h'
+#: Asks the terminal to stop marking pasted text.
+PASTE_OFF = '\x1b[?2004l'
+
+_ESCAPE = 27
+_PASTE_START = tuple(map(ord, '\x1b[200~'))
+_PASTE_END = tuple(map(ord, '\x1b[201~'))
+# Not str.isdigit, which also takes superscripts and other scripts' digits
+# that int() will not read.
+_DIGITS = frozenset('0123456789')
+
+
+class PasteParser(object):
+    """
+    Picks pasted text out of the key codes read from the terminal.
+
+    With bracketed paste on, the terminal sends ``ESC [ 200 ~`` before
+    pasted text and ``ESC [ 201 ~`` after it. The text between is gathered
+    up, however many reads it arrives in, and handed back as one string, so
+    it can be inserted in one go rather than key by key.
+    """
+
+    def __init__(self):
+        # Codes that may be the start of a marker cut off by the end of a
+        # read.
+        self._held = []
+        # Codes of the text being pasted, or None if not in a paste.
+        self._paste = None
+
+    @property
+    def pasting(self):
+        """
+        Returns
+        -------
+        bool
+            Whether the start of a paste has been read, but not its end.
+        """
+
+        return self._paste is not None
+
+    def feed(self, codes):
+        """
+        Arguments
+        ---------
+        codes : iterable of int
+            Key codes, as returned by ``getch``.
+
+        Returns
+        -------
+        list of int and str
+            The codes that were typed, and the text of each paste that
+            ended, in the order they came.
+        """
+
+        codes = self._held + list(codes)
+        self._held = []
+        events = []
+        i = 0
+        while i < len(codes):
+            if codes[i] == _ESCAPE:
+                marker = _PASTE_START if self._paste is None else _PASTE_END
+                candidate = tuple(codes[i:i + len(marker)])
+                if candidate == marker:
+                    if self._paste is None:
+                        self._paste = []
+                    else:
+                        events.append(self._text(self._paste))
+                        self._paste = None
+                    i += len(marker)
+                    continue
+                # A lone escape outside a paste is a key of its own, and is
+                # not held back waiting for more.
+                cut_off = (
+                    i + len(candidate) == len(codes)
+                    and candidate == marker[:len(candidate)]
+                    and (len(candidate) > 1 or self._paste is not None)
+                )
+                if cut_off:
+                    self._held = list(candidate)
+                    break
+            if self._paste is None:
+                events.append(codes[i])
+            else:
+                self._paste.append(codes[i])
+            i += 1
+        return events
+
+    @staticmethod
+    def _text(codes):
+        text = bytes(code for code in codes if code < 256).decode(
+            'utf-8',
+            'replace',
+        )
+        # Terminals send pasted line breaks as carriage returns.
+        return text.replace('\r\n', '\n').replace('\r', '\n')
+
+
+Binding = namedtuple('Binding', 'handler takes_count coalesce')
+
+
+def parse_keys(sequence):
+    """
+    Split a key sequence into the names of its keys.
+
+    Keys are separated by spaces, and ``C-`` before a character means that
+    character with Control held. A single character is always a key of its
+    own, even a space.
+
+    Arguments
+    ---------
+    sequence : str
+        For example ``"q"``, ``"g g"``, ``"C-x C-s"`` or ``"KEY_LEFT"``.
+
+    Returns
+    -------
+    tuple of str
+        The keys, named as ``getkey`` names them.
+    """
+
+    if len(sequence) == 1:
+        return (sequence,)
+    keys = []
+    for token in sequence.split():
+        if len(token) == 3 and token.startswith('C-'):
+            token = chr(ord(token[2].lower()) & 0x1f)
+        keys.append(token)
+    return tuple(keys)
+
+
+class _Node(object):
+    __slots__ = ('children', 'bindings')
+
+    def __init__(self):
+        self.children = {}
+        self.bindings = []
+
+
+class KeyMap(object):
+    """
+    Key bindings, kept in a trie of key sequences, so that finding what a
+    key does next costs the same however many bindings there are.
+    """
+
+    def __init__(self):
+        self.root = _Node()
+
+    def bind(self, sequence, handler, coalesce=False):
+        """
+        Arguments
+        ---------
+        sequence : str
+            The keys to bind, as understood by :py:func:`parse_keys`.
+        handler : function in (app)
+            The function to run when the keys are typed. If it takes a
+            `count` argument, it is passed the count typed before the keys,
+            and run once; otherwise it is run that many times.
+
+        Keyword Arguments
+        -----------------
+        coalesce : bool
+            Whether the application should gather up the times the keys are
+            typed before a frame, and run the handler once for all of them.
+            Default: `False`.
+        """
+
+        node = self.root
+        for key in parse_keys(sequence):
+            node = node.children.setdefault(key, _Node())
+        try:
+            takes_count = 'count' in inspect.signature(handler).parameters
+        except (TypeError, ValueError):
+            takes_count = False
+        node.bindings.append(Binding(handler, takes_count, coalesce))
+
+
+class KeySequencer(object):
+    """
+    Follows the keys typed through a list of :py:class:`.KeyMap`, matching
+    counts and sequences of keys to their bindings.
+
+    Digits typed before a sequence are taken as its count, unless bound
+    themselves. A sequence that is a binding of its own but also the start of
+    longer ones is held until either another key or :py:meth:`timeout`
+    settles which was meant.
+    """
+
+    def __init__(self):
+        self._keys = []
+        self._nodes = []
+        self._count = ''
+
+    @property
+    def pending(self):
+        """
+        Returns
+        -------
+        bool
+            Whether keys of a sequence have been typed that have not yet been
+            settled. A count on its own waits for its keys however long they
+            take.
+        """
+
+        return bool(self._keys)
+
+    def feed(self, key, keymaps):
+        """
+        Arguments
+        ---------
+        key : str
+            The key typed.
+        keymaps : list of :py:class:`.KeyMap`
+            The key maps in scope, most specific first. Where more than one
+            binds a sequence, the first wins.
+
+        Returns
+        -------
+        list of (:py:class:`.Binding`, int)
+            The bindings to run, each with its count.
+        """
+
+        if not self._keys:
+            self._nodes = [keymap.root for keymap in keymaps]
+            is_count = (
+                key in _DIGITS
+                and (self._count or key != '0')
+                and not any(key in node.children for node in self._nodes)
+            )
+            if is_count:
+                self._count += key
+                return []
+        nodes = [
+            node.children[key]
+            for node in self._nodes
+            if key in node.children
+        ]
+        if not nodes:
+            if self._keys:
+                # The keys so far do not go on with this one: settle them,
+                # and start again from it.
+                return self._settle() + self.feed(key, keymaps)
+            self._reset()
+            return []
+        self._keys.append(key)
+        self._nodes = nodes
+        if any(node.children for node in nodes):
+            return []
+        return self._settle()
+
+    def timeout(self):
+        """
+        Settle the keys typed so far, when no more have come in time.
+
+        Returns
+        -------
+        list of (:py:class:`.Binding`, int)
+            The bindings to run, each with its count.
+        """
+
+        if not self._keys:
+            return []
+        return self._settle()
+
+    def _settle(self):
+        bindings = next(
+            (node.bindings for node in self._nodes if node.bindings),
+            [],
+        )
+        count = int(self._count or 1)
+        self._reset()
+        return [(binding, count) for binding in bindings]
+
+    def _reset(self):
+        self._keys = []
+        self._nodes = []
+        self._count = ''
@@ -0,0 +1,157 @@
+"""
+This module contains the scheduler that starts the application's tasks:
+
+* :py:class:`.Scheduler`
+"""
+
+import asyncio
+from collections import deque
+
+__all__ = (
+    'BACKGROUND',
+    'INPUT',
+    'RENDER',
+    'Scheduler',
+)
+
+#: The priority of key handlers.
+INPUT = 0
+#: The priority of drawing frames.
+RENDER = 1
+#: The priority of everything else.
+BACKGROUND = 2
+
+
+class Scheduler(object):
+    """
+    Starts coroutines on an event loop in order of priority.
+
+    On each pass of the loop, every waiting :py:data:`INPUT` coroutine is
+    started, then every :py:data:`RENDER` one, then as many
+    :py:data:`BACKGROUND` ones as are expected to fit in `budget` seconds. The
+    rest wait for the next pass, so that however much background work piles
+    up, keys and frames wait behind at most a pass's worth of it.
+
+    How long a background coroutine takes is not known in advance, so it is
+    estimated from how long the loop took to get back to the scheduler after
+    the last lot were started, averaged over the passes.
+
+    Arguments
+    ---------
+    loop : asyncio.AbstractEventLoop
+
+    Keyword Arguments
+    -----------------
+    budget : float
+        The seconds of background work to start on each pass of the loop.
+        Default: `0.005`.
+    smoothing : float
+        The weight, between 0 and 1, given to the latest pass when updating
+        the estimate of how long a background coroutine takes. Default:
+        `0.2`.
+    """
+
+    def __init__(self, loop, budget=0.005, smoothing=0.2):
+        self.loop = loop
+        self.budget = budget
+        self.smoothing = smoothing
+        #: The estimated seconds a background coroutine takes, or None
+        #: before any have run.
+        self.cost = None
+        self._queues = (deque(), deque(), deque())
+        self._handle = None
+        self._admitted = 0
+        self._admitted_at = None
+
+    @property
+    def pending(self):
+        """
+        Returns
+        -------
+        int
+            The number of coroutines waiting to be started.
+        """
+
+        return sum(len(queue) for queue in self._queues)
+
+    def submit(self, coro, priority=BACKGROUND):
+        """
+        Start a coroutine on a coming pass of the loop.
+
+        Arguments
+        ---------
+        coro : coroutine
+
+        Keyword Arguments
+        -----------------
+        priority : int
+            :py:data:`INPUT`, :py:data:`RENDER` or :py:data:`BACKGROUND`.
+            Default: :py:data:`BACKGROUND`.
+
+        Returns
+        -------
+        asyncio.Future
+            The outcome of the coroutine, once it has been started and has
+            finished. Cancelling it before then means the coroutine is never
+            started; after, it cancels the task running it.
+        """
+
+        future = asyncio.Future(loop=self.loop)
+        self._queues[priority].append((coro, future))
+        if self._handle is None:
+            self._handle = self.loop.call_soon(self._run)
+        return future
+
+    def _start(self, coro, future):
+        if future.cancelled():
+            coro.close()
+            return
+        task = self.loop.create_task(coro)
+
+        def finished(task):
+            if future.cancelled():
+                return
+            if task.cancelled():
+                future.cancel()
+            elif task.exception() is not None:
+                future.set_exception(task.exception())
+            else:
+                future.set_result(task.result())
+
+        def cancelled(future):
+            if future.cancelled():
+                task.cancel()
+
+        task.add_done_callback(finished)
+        future.add_done_callback(cancelled)
+
+    def _run(self):
+        self._handle = None
+        if self._admitted:
+            # The loop has been running what was started last pass since.
+            cost = (self.loop.time() - self._admitted_at) / self._admitted
+            if self.cost is None:
+                self.cost = cost
+            else:
+                self.cost += self.smoothing * (cost - self.cost)
+            self._admitted = 0
+        for queue in self._queues[:BACKGROUND]:
+            while queue:
+                self._start(*queue.popleft())
+        background = self._queues[BACKGROUND]
+        if background:
+            if self.cost is None:
+                admit = 1
+            else:
+                admit = max(1, int(self.budget / max(self.cost, 1e-6)))
+            admit = min(admit, len(background))
+            for _ in range(admit):
+                self._start(*background.popleft())
+            self._admitted = admit
+            self._admitted_at = self.loop.time()
+        if self.pending:
+            self._handle = self.loop.call_soon(self._run)
+        else:
+            # The next pass may be after the loop has sat idle, which says
+            # nothing about how long this lot took.
+            self._admitted = 0
@@ -0,0 +1,119 @@
+"""
+This module contains the sources that feed text into boxes:
+
+* :py:class:`.StreamSource`
+"""
+
+import asyncio
+
+try:
+    StopAsyncIteration
+except NameError:
+    # Python 3.4 has no asynchronous iterators.
+    StopAsyncIteration = StopIteration
+
+__all__ = (
+    'StreamSource',
+)
+
+
+class StreamSource(object):
+    """
+    Pumps lines from a stream into a box.
+
+    Lines are held until the next frame, and then added to the box in one
+    go. Once `max_pending` lines are waiting, the pump stops reading until
+    they have been added, leaving the rest of the stream to back up in its
+    own buffers.
+
+    Use :py:meth:`.Application.attach` rather than making one directly.
+
+    Arguments
+    ---------
+    box : :py:class:`.Box`
+        The box to add the lines to.
+    stream : asyncio.StreamReader, subprocess or async iterator
+        Where to read lines from. For an
+        :py:class:`asyncio.subprocess.Process`, its standard output is read.
+
+    Keyword Arguments
+    -----------------
+    max_pending : int
+        The most lines to hold between frames. Default: `10000`.
+    encoding : str
+        The encoding of streams that produce bytes. Default: `"utf-8"`.
+    """
+
+    def __init__(self, box, stream, max_pending=10000, encoding='utf-8'):
+        self.box = box
+        self.stream = stream
+        self.max_pending = max_pending
+        self.encoding = encoding
+        self.finished = False
+        self._pending = []
+        self._drained = asyncio.Event()
+        self._drained.set()
+        if isinstance(getattr(stream, 'stdout', None), asyncio.StreamReader):
+            self.stream = stream.stdout
+        if hasattr(self.stream, '__aiter__'):
+            self._iterator = self.stream.__aiter__()
+        else:
+            self._iterator = None
+
+    @property
+    def pending(self):
+        """
+        Returns
+        -------
+        int
+            The number of lines read but not yet added to the box.
+        """
+
+        return len(self._pending)
+
+    @asyncio.coroutine
+    def _read(self):
+        if self._iterator is None:
+            line = yield from self.stream.readline()
+            if not line:
+                return None
+        else:
+            try:
+                line = yield from self._iterator.__anext__()
+            except StopAsyncIteration:
+                return None
+        if isinstance(line, bytes):
+            line = line.decode(self.encoding, 'replace')
+        if not line.endswith('\n'):
+            line += '\n'
+        return line
+
+    @asyncio.coroutine
+    def pump(self, app):
+        """
+        Read lines until the stream ends, asking `app` for a frame whenever
+        lines start waiting.
+        """
+
+        while True:
+            yield from self._drained.wait()
+            line = yield from self._read()
+            if line is None:
+                break
+            self._pending.append(line)
+            if len(self._pending) == 1:
+                app.request_render()
+            if len(self._pending) >= self.max_pending:
+                self._drained.clear()
+        self.finished = True
+        app.request_render()
+
+    def flush(self):
+        """
+        Add the waiting lines to the box, and let the pump read more.
+        """
+
+        if self._pending:
+            self.box.append_text(''.join(self._pending))
+            self._pending = []
+        self._drained.set()
@@ -0,0 +1,858 @@
+"""
+This module contains the text storage behind boxes:
+
+* :py:class:`.Rope`
+* :py:class:`.LineRing`
+* :py:class:`.MappedText`
+* :py:class:`.HexDump`
+* :py:class:`.GapBuffer`
+"""
+
+import mmap
+import os
+from bisect import bisect_left
+from collections import OrderedDict
+
+__all__ = (
+    'GapBuffer',
+    'HexDump',
+    'LineRing',
+    'MappedText',
+    'Rope',
+)
+
+
+class _Leaf(object):
+    __slots__ = ('text', 'length', 'newlines', 'height')
+
+    def __init__(self, text):
+        self.text = text
+        self.length = len(text)
+        self.newlines = text.count("\n")
+        self.height = 0
+
+
+class _Branch(object):
+    __slots__ = ('left', 'right', 'length', 'newlines', 'height')
+
+    def __init__(self, left, right):
+        self.left = left
+        self.right = right
+        self.length = left.length + right.length
+        self.newlines = left.newlines + right.newlines
+        self.height = max(left.height, right.height) + 1
+
+
+def _balance(node):
+    """
+    Restore the height invariant of a branch whose children differ in height
+    by at most two, with a single or double rotation.
+    """
+
+    left, right = node.left, node.right
+    if left.height > right.height + 1:
+        if left.left.height >= left.right.height:
+            return _Branch(left.left, _Branch(left.right, right))
+        return _Branch(
+            _Branch(left.left, left.right.left),
+            _Branch(left.right.right, right),
+        )
+    if right.height > left.height + 1:
+        if right.right.height >= right.left.height:
+            return _Branch(_Branch(left, right.left), right.right)
+        return _Branch(
+            _Branch(left, right.left.left),
+            _Branch(right.left.right, right.right),
+        )
+    return node
+
+
+def _join(left, right):
+    """
+    Concatenate two trees, in time proportional to the difference in their
+    heights.
+    """
+
+    if left is None:
+        return right
+    if right is None:
+        return left
+    if left.height > right.height + 1:
+        return _balance(_Branch(left.left, _join(left.right, right)))
+    if right.height > left.height + 1:
+        return _balance(_Branch(_join(left, right.left), right.right))
+    return _Branch(left, right)
+
+
+def _split(node, index):
+    """
+    Split a tree into the trees holding the text before and after `index`.
+    """
+
+    if node is None or index <= 0:
+        return None, node
+    if index >= node.length:
+        return node, None
+    if isinstance(node, _Leaf):
+        return _Leaf(node.text[:index]), _Leaf(node.text[index:])
+    if index < node.left.length:
+        left, right = _split(node.left, index)
+        return left, _join(right, node.right)
+    if index == node.left.length:
+        return node.left, node.right
+    left, right = _split(node.right, index - node.left.length)
+    return _join(node.left, left), right
+
+
+def _build(text, chunk_size):
+    """
+    Build a balanced tree over `text`, with leaves of at most `chunk_size`
+    characters.
+    """
+
+    if not text:
+        return None
+    leaves = [
+        _Leaf(text[i:i + chunk_size])
+        for i in range(0, len(text), chunk_size)
+    ]
+    while len(leaves) > 1:
+        paired = [
+            _Branch(leaves[i], leaves[i + 1])
+            for i in range(0, len(leaves) - 1, 2)
+        ]
+        if len(leaves) % 2:
+            paired.append(leaves[-1])
+        leaves = paired
+    return leaves[0]
+
+
+def _extend_last_leaf(node, text):
+    if isinstance(node, _Leaf):
+        return _Leaf(node.text + text)
+    return _Branch(node.left, _extend_last_leaf(node.right, text))
+
+
+def _last_leaf(node):
+    while not isinstance(node, _Leaf):
+        node = node.right
+    return node
+
+
+def _newline_offset(node, n):
+    """
+    The offset of the `n`th newline (counting from one) under `node`, found
+    by following the newline counts down to a single chunk.
+    """
+
+    offset = 0
+    while not isinstance(node, _Leaf):
+        if n <= node.left.newlines:
+            node = node.left
+        else:
+            n -= node.left.newlines
+            offset += node.left.length
+            node = node.right
+    index = -1
+    for _ in range(n):
+        index = node.text.index("\n", index + 1)
+    return offset + index
+
+
+def _map_file(path):
+    """
+    Map a file for reading, returning its size and the mapping.
+    """
+
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if not size:
+            # Empty files cannot be mapped.
+            return size, b''
+        return size, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def _pieces(node, start, stop):
+    """
+    Yield the pieces of text between `start` and `stop`, visiting only the
+    leaves that overlap that range.
+    """
+
+    stack = [(node, 0)]
+    while stack:
+        node, offset = stack.pop()
+        if node is None or offset >= stop or offset + node.length <= start:
+            continue
+        if isinstance(node, _Leaf):
+            yield node.text[max(0, start - offset):stop - offset]
+        else:
+            # Right first, so that the left is popped first.
+            stack.append((node.right, offset + node.left.length))
+            stack.append((node.left, offset))
+
+
+class Rope(object):
+    """
+    A string held as a balanced tree of chunks, so that appending, inserting
+    and slicing take time logarithmic in its length, rather than copying the
+    whole string.
+
+    Every chunk also counts its newlines, which makes the tree an index of
+    where lines start, kept up to date by every edit.
+
+    Keyword Arguments
+    -----------------
+    text : str
+        The initial contents. Default: `""`.
+    chunk_size : int
+        The most characters to keep in one chunk. Default: `1024`.
+    """
+
+    def __init__(self, text="", chunk_size=1024):
+        self.chunk_size = chunk_size
+        self._root = _build(text, chunk_size)
+
+    def __len__(self):
+        if self._root is None:
+            return 0
+        return self._root.length
+
+    def __str__(self):
+        return "".join(_pieces(self._root, 0, len(self)))
+
+    def __repr__(self):
+        return "Rope({!r})".format(str(self))
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            if key < 0:
+                key += len(self)
+            if not 0 <= key < len(self):
+                raise IndexError("Rope index out of range")
+            key = slice(key, key + 1)
+        start, stop, step = key.indices(len(self))
+        if step != 1:
+            return str(self)[key]
+        return "".join(_pieces(self._root, start, stop))
+
+    @property
+    def line_count(self):
+        """
+        Returns
+        -------
+        int
+            The number of newlines in the text.
+        """
+
+        if self._root is None:
+            return 0
+        return self._root.newlines
+
+    def line_start(self, line):
+        """
+        Arguments
+        ---------
+        line : int
+            A line number, counting from zero.
+
+        Returns
+        -------
+        int
+            The offset of the first character of `line`. Lines past the last
+            newline start at the end of the text.
+        """
+
+        if line <= 0:
+            return 0
+        if line > self.line_count:
+            return len(self)
+        return _newline_offset(self._root, line) + 1
+
+    def lines(self, start, stop):
+        """
+        Arguments
+        ---------
+        start : int
+            The first line to return, counting from zero.
+        stop : int
+            The line to stop before.
+
+        Returns
+        -------
+        list of str
+            The lines from `start` up to `stop`, without their newlines.
+        """
+
+        if stop <= start:
+            return []
+        text = self[self.line_start(start):self.line_start(stop)]
+        if stop <= self.line_count:
+            # Drop the newline ending the last line we asked for.
+            text = text[:-1]
+        elif not text:
+            return []
+        return text.split("\n")
+
+    def append(self, text):
+        """
+        Add text to the end.
+
+        Arguments
+        ---------
+        text : str
+            The text to add.
+        """
+
+        if not text:
+            return
+        if self._root is not None:
+            last = _last_leaf(self._root)
+            if last.length + len(text) <= self.chunk_size:
+                self._root = _extend_last_leaf(self._root, text)
+                return
+        self._root = _join(self._root, _build(text, self.chunk_size))
+
+    def insert(self, index, text):
+        """
+        Add text before the character at `index`.
+
+        Arguments
+        ---------
+        index : int
+            Where to put the text.
+        text : str
+            The text to add.
+        """
+
+        if not text:
+            return
+        left, right = _split(self._root, index)
+        self._root = _join(_join(left, _build(text, self.chunk_size)), right)
+
+
+class LineRing(object):
+    """
+    Text kept as a ring of lines, which forgets its oldest lines once it
+    holds more than `max_lines` of them, or more than `max_bytes` bytes of
+    them. Forgetting a line takes constant time, so the memory used stays
+    flat however long text is appended for.
+
+    It can be read the same way as a :py:class:`.Rope`.
+
+    Keyword Arguments
+    -----------------
+    text : str
+        The initial contents. Default: `""`.
+    max_lines : int
+        The most complete lines to keep. Default: no limit.
+    max_bytes : int
+        The most bytes of complete lines, in UTF-8 with their newlines, to
+        keep. Default: no limit.
+    """
+
+    def __init__(self, text="", max_lines=None, max_bytes=None):
+        self.max_lines = max_lines
+        self.max_bytes = max_bytes
+        self.evicted = 0
+        # Complete lines, without their newlines, from _head onwards; the
+        # ones before it have been forgotten.
+        self._lines = []
+        self._head = 0
+        # Whatever follows the last newline.
+        self._tail = ""
+        self._length = 0
+        self._bytes = 0
+        self.append(text)
+
+    def __len__(self):
+        return self._length + len(self._tail)
+
+    def __str__(self):
+        if not self.line_count:
+            return self._tail
+        return "\n".join(self._lines[self._head:]) + "\n" + self._tail
+
+    def __repr__(self):
+        return "LineRing({!r})".format(str(self))
+
+    @property
+    def line_count(self):
+        """
+        Returns
+        -------
+        int
+            The number of newlines in the text.
+        """
+
+        return len(self._lines) - self._head
+
+    def lines(self, start, stop):
+        """
+        Arguments
+        ---------
+        start : int
+            The first line to return, counting from zero.
+        stop : int
+            The line to stop before.
+
+        Returns
+        -------
+        list of str
+            The lines from `start` up to `stop`, without their newlines.
+        """
+
+        start = max(0, start)
+        count = self.line_count
+        rows = self._lines[self._head + start:self._head + min(stop, count)]
+        if start <= count < stop and self._tail:
+            rows.append(self._tail)
+        return rows
+
+    def append(self, text):
+        """
+        Add text to the end, and forget the oldest lines if that takes the
+        ring over its limits.
+
+        Arguments
+        ---------
+        text : str
+            The text to add.
+
+        Returns
+        -------
+        int
+            The number of lines forgotten.
+        """
+
+        if not text:
+            return 0
+        lines = (self._tail + text).split("\n")
+        self._tail = lines.pop()
+        for line in lines:
+            self._lines.append(line)
+            self._length += len(line) + 1
+            self._bytes += len(line.encode("utf-8")) + 1
+        return self._evict()
+
+    def _evict(self):
+        evicted = 0
+        while self.line_count and (
+            (self.max_lines is not None and self.line_count > self.max_lines)
+            or (self.max_bytes is not None and self._bytes > self.max_bytes)
+        ):
+            line = self._lines[self._head]
+            self._lines[self._head] = None
+            self._head += 1
+            self._length -= len(line) + 1
+            self._bytes -= len(line.encode("utf-8")) + 1
+            evicted += 1
+        # Drop the forgotten slots once they are the larger part of the list,
+        # so that this stays constant time per line on average.
+        if self._head > len(self._lines) // 2:
+            del self._lines[:self._head]
+            self._head = 0
+        self.evicted += evicted
+        return evicted
+
+
+class MappedText(object):
+    """
+    The text of a file, read through ``mmap`` rather than into memory, so
+    that files far larger than memory can be shown.
+
+    Lines are found through an index of how many newlines come before each
+    chunk of the file. The index is built a few chunks at a time by
+    :py:meth:`index_step`, and only the part of the file indexed so far can
+    be read; finding a line then means scanning at most one chunk.
+
+    It can be read the same way as a :py:class:`.Rope`.
+
+    Arguments
+    ---------
+    path : str
+        The file to show. Its size is taken when it is opened.
+
+    Keyword Arguments
+    -----------------
+    encoding : str
+        How to decode the file. Undecodable bytes are replaced. Default:
+        `"utf-8"`.
+    chunk_size : int
+        The number of bytes covered by each entry in the index. Default:
+        `65536`.
+    """
+
+    def __init__(self, path, encoding='utf-8', chunk_size=1 << 16):
+        self.path = path
+        self.encoding = encoding
+        self.chunk_size = chunk_size
+        self.size, self._map = _map_file(path)
+        self.closed = False
+        # _counts[k] is the number of newlines before chunk k.
+        self._counts = [0]
+        self._indexed = 0
+
+    def __len__(self):
+        return self.size
+
+    def __str__(self):
+        return self._decode(0, self.size)
+
+    def __repr__(self):
+        return "MappedText({!r})".format(self.path)
+
+    def close(self):
+        """
+        Unmap the file. Nothing more can be read from it after this.
+        """
+
+        if self.size and not self.closed:
+            self._map.close()
+        self.closed = True
+
+    @property
+    def complete(self):
+        """
+        Returns
+        -------
+        bool
+            Whether the whole file has been indexed.
+        """
+
+        return self._indexed >= self.size
+
+    def index_step(self, chunks=16):
+        """
+        Index the next few chunks of the file.
+
+        Keyword Arguments
+        -----------------
+        chunks : int
+            How many chunks to index. Default: `16`.
+
+        Returns
+        -------
+        bool
+            Whether the whole file has now been indexed.
+        """
+
+        for _ in range(chunks):
+            if self.complete:
+                break
+            end = min(self._indexed + self.chunk_size, self.size)
+            newlines = self._map[self._indexed:end].count(b'\n')
+            self._counts.append(self._counts[-1] + newlines)
+            self._indexed = end
+        return self.complete
+
+    @property
+    def line_count(self):
+        """
+        Returns
+        -------
+        int
+            The number of newlines in the part of the file indexed so far.
+        """
+
+        return self._counts[-1]
+
+    def line_start(self, line):
+        """
+        Arguments
+        ---------
+        line : int
+            A line number, counting from zero.
+
+        Returns
+        -------
+        int
+            The byte offset of the start of `line`. Lines past the last
+            indexed newline start at the end of the indexed part of the file.
+        """
+
+        if line <= 0:
+            return 0
+        if line > self.line_count:
+            return self._indexed
+        chunk = bisect_left(self._counts, line) - 1
+        offset = chunk * self.chunk_size - 1
+        for _ in range(line - self._counts[chunk]):
+            offset = self._map.find(b'\n', offset + 1)
+        return offset + 1
+
+    def lines(self, start, stop):
+        """
+        Arguments
+        ---------
+        start : int
+            The first line to return, counting from zero.
+        stop : int
+            The line to stop before.
+
+        Returns
+        -------
+        list of str
+            The lines from `start` up to `stop`, without their newlines.
+        """
+
+        start = max(0, start)
+        stop = min(stop, self.line_count + 1)
+        offset = self.line_start(start)
+        rows = []
+        for _ in range(start, stop):
+            end = self._map.find(b'\n', offset, self._indexed)
+            if end == -1:
+                # Only the end of the file has no newline after it.
+                if self.complete and offset < self.size:
+                    rows.append(self._decode(offset, self.size))
+                break
+            rows.append(self._decode(offset, end))
+            offset = end + 1
+        return rows
+
+    def _decode(self, start, stop):
+        return self._map[start:stop].decode(self.encoding, 'replace')
+
+
+class HexDump(object):
+    """
+    A hex dump of a file, read through ``mmap``, with a row for every
+    `bytes_per_row` bytes: the offset, the bytes in hex, and the bytes that
+    are printable ASCII.
+
+    Rows are only formatted when asked for, and the most recently used are
+    kept, so opening even a very large file costs nothing, and showing a
+    screenful costs the same wherever it is in the file.
+
+    It can be read the same way as a :py:class:`.Rope`, with a row per line.
+
+    Arguments
+    ---------
+    path : str
+        The file to show. Its size is taken when it is opened.
+
+    Keyword Arguments
+    -----------------
+    bytes_per_row : int
+        Default: `16`.
+    cache_size : int
+        The most formatted rows to keep. Default: `4096`.
+    """
+
+    def __init__(self, path, bytes_per_row=16, cache_size=4096):
+        self.path = path
+        self.bytes_per_row = bytes_per_row
+        self.cache_size = cache_size
+        self.size, self._map = _map_file(path)
+        self.closed = False
+        self._rows = OrderedDict()
+
+    def __len__(self):
+        return self.line_count
+
+    def __str__(self):
+        return "".join(
+            row + "\n" for row in self.lines(0, self.line_count)
+        )
+
+    def __repr__(self):
+        return "HexDump({!r})".format(self.path)
+
+    def close(self):
+        """
+        Unmap the file. Nothing more can be read from it after this.
+        """
+
+        if self.size and not self.closed:
+            self._map.close()
+        self.closed = True
+
+    @property
+    def line_count(self):
+        """
+        Returns
+        -------
+        int
+            The number of rows.
+        """
+
+        return -(-self.size // self.bytes_per_row)
+
+    def row_of(self, offset):
+        """
+        Arguments
+        ---------
+        offset : int
+            A byte offset into the file.
+
+        Returns
+        -------
+        int
+            The row showing that byte.
+        """
+
+        return offset // self.bytes_per_row
+
+    def lines(self, start, stop):
+        """
+        Arguments
+        ---------
+        start : int
+            The first row to return, counting from zero.
+        stop : int
+            The row to stop before.
+
+        Returns
+        -------
+        list of str
+            The formatted rows from `start` up to `stop`.
+        """
+
+        return [
+            self._row(row)
+            for row in range(max(0, start), min(stop, self.line_count))
+        ]
+
+    def _row(self, row):
+        try:
+            text = self._rows[row]
+        except KeyError:
+            text = self._format(row)
+            self._rows[row] = text
+            if len(self._rows) > self.cache_size:
+                self._rows.popitem(last=False)
+        else:
+            self._rows.move_to_end(row)
+        return text
+
+    def _format(self, row):
+        offset = row * self.bytes_per_row
+        data = self._map[offset:offset + self.bytes_per_row]
+        hex_bytes = [format(byte, '02x') for byte in data]
+        hex_bytes += ['  '] * (self.bytes_per_row - len(data))
+        half = self.bytes_per_row // 2
+        return '{:08x}  {}  {}  |{}|'.format(
+            offset,
+            ' '.join(hex_bytes[:half]),
+            ' '.join(hex_bytes[half:]),
+            ''.join(
+                chr(byte) if 0x20 <= byte < 0x7f else '.'
+                for byte in data
+            ),
+        )
+
+
+class GapBuffer(object):
+    """
+    Text being edited at a cursor.
+
+    The text is kept in a list with a gap at the cursor, so typing and
+    deleting at the cursor do not copy the rest of the text; only moving the
+    cursor shifts the characters it passes over. The text is only joined into
+    a string when read, and that string is kept until the next change.
+
+    Arguments
+    ---------
+    text : str
+        The text to start with. The cursor starts at its end.
+
+    Keyword Arguments
+    -----------------
+    gap : int
+        The room to leave for typing before the list has to grow.
+        Default: `64`.
+    """
+
+    def __init__(self, text="", gap=64):
+        self._chars = list(text) + [None] * gap
+        self._gap_start = len(text)
+        self._gap_end = len(self._chars)
+        self._text = text
+
+    def __len__(self):
+        return len(self._chars) - (self._gap_end - self._gap_start)
+
+    def __str__(self):
+        if self._text is None:
+            self._text = (
+                "".join(self._chars[:self._gap_start])
+                + "".join(self._chars[self._gap_end:])
+            )
+        return self._text
+
+    def __repr__(self):
+        return "GapBuffer({!r})".format(str(self))
+
+    @property
+    def cursor(self):
+        """
+        Returns
+        -------
+        int
+            Where the next character typed will go.
+        """
+
+        return self._gap_start
+
+    def move(self, position):
+        """
+        Move the cursor.
+
+        Arguments
+        ---------
+        position : int
+            The new position, which is clamped to the text.
+        """
+
+        position = max(0, min(len(self), position))
+        chars = self._chars
+        if position < self._gap_start:
+            count = self._gap_start - position
+            chars[self._gap_end - count:self._gap_end] = (
+                chars[position:self._gap_start]
+            )
+            self._gap_start -= count
+            self._gap_end -= count
+        elif position > self._gap_start:
+            count = position - self._gap_start
+            chars[self._gap_start:position] = (
+                chars[self._gap_end:self._gap_end + count]
+            )
+            self._gap_start += count
+            self._gap_end += count
+
+    def insert(self, text):
+        """
+        Insert text at the cursor, leaving the cursor after it.
+        """
+
+        count = len(text)
+        if count > self._gap_end - self._gap_start:
+            # Grow by at least the current size, so that typing costs
+            # constant time on average.
+            gap = count + len(self._chars)
+            self._chars[self._gap_start:self._gap_end] = [None] * gap
+            self._gap_end = self._gap_start + gap
+        self._chars[self._gap_start:self._gap_start + count] = text
+        self._gap_start += count
+        self._text = None
+
+    def delete(self, count=1):
+        """
+        Delete up to `count` characters after the cursor.
+        """
+
+        count = min(count, len(self._chars) - self._gap_end)
+        if count:
+            self._gap_end += count
+            self._text = None
+
+    def backspace(self, count=1):
+        """
+        Delete up to `count` characters before the cursor.
+        """
+
+        count = min(count, self._gap_start)
+        if count:
+            self._gap_start -= count
+            self._text = None
@@ -1,16 +1,23 @@
 from collections import (
     Iterable,
+    OrderedDict,
     namedtuple,
 )
 from textwrap import wrap
 
 __all__ = (
+    'Geometry',
     'Point',
+    'WrapCache',
     'flatten',
     'wrap_by_paragraph',
 )
 
 Point = namedtuple('Point', 'x y')
+Geometry = namedtuple(
+    'Geometry',
+    'x y width height available_width available_height',
+)
 
 stringlike = (str, bytes)
 
@@ -28,14 +35,63 @@ def flatten(container):
             yield i
 
 
-def wrap_by_paragraph(text, width=70, **kwargs):
+class WrapCache(object):
+    """
+    A least-recently-used cache of wrapped paragraphs, keyed by the text of
+    the paragraph and the width (and any other options) it was wrapped with.
+
+    Keyword Arguments
+    -----------------
+    maxsize : int
+        The most paragraphs to remember. Default: `1024`.
+    """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def wrap(self, paragraph, width=70, **kwargs):
+        """
+        Hard-wrap a single paragraph, or return it from the cache if it has
+        been wrapped the same way before.
+        """
+
+        key = (paragraph, width, tuple(sorted(kwargs.items())))
+        try:
+            wrapped = self._entries[key]
+        except KeyError:
+            self.misses += 1
+            wrapped = '\n'.join(wrap(paragraph, width=width, **kwargs))
+            self._entries[key] = wrapped
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        else:
+            self.hits += 1
+            self._entries.move_to_end(key)
+        return wrapped
+
+
+def wrap_by_paragraph(text, width=70, cache=None, **kwargs):
     """
     Takes a string and hard-wraps it to the specified width, preserving
     double-linebreaks to preserve paragraphs.
+
+    If a :py:class:`.WrapCache` is given as `cache`, only paragraphs it has
+    not seen at this width are wrapped again.
     """
 
     paragraphs = text.split('\n\n')
+    if cache is None:
+        return '\n\n'.join(
+            '\n'.join(wrap(paragraph, width=width, **kwargs))
+            for paragraph in paragraphs
+        )
     return '\n\n'.join(
-        '\n'.join(wrap(paragraph, width=width, **kwargs))
+        cache.wrap(paragraph, width=width, **kwargs)
         for paragraph in paragraphs
     )
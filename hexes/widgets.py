@@ -0,0 +1,149 @@
+"""
+This module contains boxes made for showing particular kinds of content:
+
+* :py:class:`.FileBox`
+* :py:class:`.HexBox`
+"""
+
+import asyncio
+from .hexes import Box
+from .text import (
+    HexDump,
+    MappedText,
+)
+
+__all__ = (
+    'FileBox',
+    'HexBox',
+)
+
+
+class FileBox(Box):
+    """
+    A box showing a file, which may be far too large to read into memory.
+
+    The file is mapped rather than read, and lines are found through an
+    index of it that is built in the background once the box is shown. Only
+    the lines in view are ever read. The box scrolls like any other, over
+    as much of the file as has been indexed so far.
+
+    Reading :py:attr:`text` reads the whole file, and flowing the text does
+    the same, so leave `flow` off.
+
+    Arguments
+    ---------
+    path : str
+        The file to show.
+
+    Keyword Arguments
+    -----------------
+    encoding : str
+        How to decode the file. Default: `"utf-8"`.
+
+    Any other keyword arguments are passed on to :py:class:`.Box`.
+    """
+
+    def __init__(self, path, encoding='utf-8', **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self.encoding = encoding
+        self._buffer = MappedText(path, encoding=encoding)
+        self._indexing = False
+
+    def mount(self, app):
+        """
+        Start indexing the file in the background, mapping it again first
+        if the box was unmounted.
+        """
+
+        if self._buffer.closed:
+            self._buffer = MappedText(self.path, encoding=self.encoding)
+            # Indexing of the old mapping stops by itself.
+            self._indexing = False
+        if not self._indexing and not self._buffer.complete:
+            self._indexing = True
+            app.schedule(self._index)
+
+    def unmount(self, app):
+        """
+        Unmap the file, stopping any indexing.
+        """
+
+        self._buffer.close()
+
+    @asyncio.coroutine
+    def _index(self, app):
+        buffer = self._buffer
+        while not buffer.closed:
+            shown = buffer.line_count >= (
+                self._text_offset + self.inner_height
+            )
+            complete = buffer.index_step()
+            # Only redraw while the lines in view are still being found.
+            if complete or not shown:
+                self.damage()
+            if complete:
+                break
+            yield from asyncio.sleep(0)
+        if buffer is self._buffer:
+            self._indexing = False
+
+
+class HexBox(Box):
+    """
+    A box showing a hex dump of a file, which may be far too large to read
+    into memory.
+
+    The file is mapped rather than read, and only the rows in view are
+    formatted, so it opens at once whatever its size. It scrolls a row at a
+    time like any other box, and :py:meth:`jump` goes straight to the row
+    holding a given byte.
+
+    Arguments
+    ---------
+    path : str
+        The file to show.
+
+    Keyword Arguments
+    -----------------
+    bytes_per_row : int
+        Default: `16`.
+
+    Any other keyword arguments are passed on to :py:class:`.Box`.
+    """
+
+    def __init__(self, path, bytes_per_row=16, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self.bytes_per_row = bytes_per_row
+        self._buffer = HexDump(path, bytes_per_row=bytes_per_row)
+
+    def mount(self, app):
+        """
+        Map the file again, if the box was unmounted.
+        """
+
+        if self._buffer.closed:
+            self._buffer = HexDump(
+                self.path,
+                bytes_per_row=self.bytes_per_row,
+            )
+
+    def unmount(self, app):
+        """
+        Unmap the file.
+        """
+
+        self._buffer.close()
+
+    def jump(self, offset):
+        """
+        Scroll so that the row holding byte `offset` is at the top.
+
+        Arguments
+        ---------
+        offset : int
+            A byte offset into the file.
+        """
+
+        self.scroll_to(self._buffer.row_of(offset))
@@ -0,0 +1,72 @@
+import asyncio
+import curses
+import pytest
+from collections import deque
+from hexes.hexes import Application
+
+
+@pytest.fixture
+def loop(request):
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    request.addfinalizer(loop.close)
+    return loop
+
+
+class FakeWindow(object):
+    """
+    Stands in for a curses window or pad, and records what is done to it.
+    """
+
+    def __init__(self, lines, columns, y=0, x=0):
+        self.size = (lines, columns)
+        self.position = (y, x)
+        self.calls = []
+        self.rows = {}
+        self.keys = deque()
+
+    def getmaxyx(self):
+        return self.size
+
+    def resize(self, lines, columns):
+        self.calls.append(('resize', lines, columns))
+        self.size = (lines, columns)
+
+    def mvwin(self, y, x):
+        self.calls.append(('mvwin', y, x))
+        self.position = (y, x)
+
+    def erase(self):
+        self.calls.append(('erase',))
+        self.rows = {}
+
+    def addnstr(self, y, x, text, n):
+        self.rows[y] = text[:n]
+
+    def getch(self):
+        return self.keys.popleft() if self.keys else -1
+
+    def __getattr__(self, name):
+        def record(*args):
+            self.calls.append((name,) + args)
+        return record
+
+
+@pytest.fixture
+def application(loop, monkeypatch):
+    """
+    An application drawing on fake curses windows. ``curses.doupdate``
+    is recorded on the screen's calls.
+    """
+
+    screen = FakeWindow(40, 100)
+    monkeypatch.setattr(curses, 'initscr', lambda: screen)
+    monkeypatch.setattr(curses, 'newwin', FakeWindow)
+    monkeypatch.setattr(curses, 'newpad', FakeWindow)
+    monkeypatch.setattr(
+        curses,
+        'doupdate',
+        lambda: screen.calls.append(('doupdate',)),
+    )
+    monkeypatch.setattr(curses, 'keyname', lambda ch: chr(ch).encode())
+    return Application()
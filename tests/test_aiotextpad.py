@@ -0,0 +1,118 @@
+import curses
+from hexes.aiotextpad import AsyncTextbox
+from hexes.hexes import (
+    Box,
+    FocusManager,
+)
+
+
+class Win:
+    def __init__(self):
+        self.y, self.x = 0, 0
+
+    def getmaxyx(self):
+        return 1, 80
+
+    def getyx(self):
+        return self.y, self.x
+
+    def keypad(self, flag):
+        pass
+
+    def move(self, y, x):
+        self.y, self.x = y, x
+
+
+def test_do_command():
+    textbox = AsyncTextbox(Win(), box=None, app=None)
+    for ch in "hexes":
+        assert textbox.do_command(ord(ch))
+    assert textbox.characters == "hexes"
+    assert textbox.do_command(curses.KEY_BACKSPACE)
+    assert textbox.characters == "hexe"
+    textbox.do_command(curses.KEY_LEFT)
+    textbox.do_command(curses.KEY_LEFT)
+    textbox.do_command(ord("l"))
+    assert textbox.characters == "helxe"
+    assert textbox.cursor == 3
+    assert textbox.do_command(curses.ascii.BEL) == 0
+    # Unbound, unprintable keys are returned as they are.
+    assert textbox.do_command(curses.KEY_F1) == curses.KEY_F1
+
+
+def test_bind():
+    textbox = AsyncTextbox(Win(), box=None, app=None)
+    seen = []
+    textbox.bind("q", lambda textbox, ch, x, y: seen.append(ch))
+    assert textbox.do_command(ord("q")) is None
+    assert seen == [ord("q")]
+    assert textbox.characters == ""
+
+
+class App:
+    def __init__(self):
+        self.scheduled = []
+        self.triggered = []
+        self.focus = FocusManager(self)
+
+    def schedule(self, coro_func, priority=None):
+        self.scheduled.append(coro_func)
+
+    def trigger(self, event, **kwargs):
+        self.triggered.append((event, kwargs))
+
+
+def test_process_key():
+    box = Box()
+    app = App()
+    textbox = AsyncTextbox(Win(), box=box, app=app)
+    textbox.edit(validate=lambda ch: ch + 1, callback=lambda **kwargs: None)
+    for ch in "gdwd":
+        textbox.process_key(ord(ch))
+    assert textbox.is_active
+    assert box.dirty
+    assert app.focus.active_textbox is textbox
+    textbox.process_key(curses.ascii.BEL - 1)
+    assert not textbox.is_active
+    assert app.focus.active_textbox is None
+    assert app.focus.box is box
+    assert app.scheduled[0].keywords["characters"] == "hexe"
+
+
+def test_paste():
+    box = Box()
+    textbox = AsyncTextbox(Win(), box=box, app=App())
+    validated = []
+    textbox.edit(
+        validate=lambda ch: 7,
+        validate_paste=lambda text: validated.append(text) or text.upper(),
+    )
+    textbox.paste("hexes\n" * 1000)
+    assert validated == ["hexes\n" * 1000]
+    assert textbox.characters == "HEXES\n" * 1000
+    assert textbox.cursor == 6000
+
+
+def test_focus_events():
+    app = App()
+    first, second = Box(), Box()
+    app.focus.set(first)
+    app.focus.set(first)
+    app.focus.set(second)
+    app.focus.clear()
+    assert app.triggered == [
+        ("focus", {"box": first}),
+        ("blur", {"box": first}),
+        ("focus", {"box": second}),
+        ("blur", {"box": second}),
+    ]
+
+
+def test_paste_through_key_validation():
+    box = Box()
+    textbox = AsyncTextbox(Win(), box=box, app=App())
+    # Ends editing at the first space.
+    textbox.edit(validate=lambda ch: curses.ascii.BEL if ch == 32 else ch)
+    textbox.paste("hexes rocks")
+    assert not textbox.is_active
+    assert textbox.characters == "hexes"
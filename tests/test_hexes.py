@@ -1,9 +1,13 @@
 # -*- coding: utf-8 -*-
+import asyncio
 import pytest
+from functools import partial
 from hexes.hexes import (
     Box,
     Style,
+    Window,
 )
+from hexes.keys import KeyMap
 
 
 @pytest.fixture
@@ -189,3 +193,498 @@ def test_add_children(tree):
     tree.add_children(box1, box2)
     assert box1.parent == tree
     assert box2.parent == tree
+
+
+def test_layout_fills_table_for_every_box(tree):
+    tree.layout()
+    assert set(tree._layout_table) == set(tree.traverse_pre_order)
+    assert tree._layout_table[tree.children[1]].y == 50
+
+
+def test_add_child_relays_out_parent_only(tree):
+    tree.layout()
+    box = Box()
+    tree.children[0].add_child(box)
+    assert tree._layout_pending == {tree.children[0]}
+    changed = tree.layout()
+    assert changed == {box} | set(tree.children[0].children)
+    assert box.upper_left == (2, 32)
+
+
+def test_style_change_invalidates_layout(tree):
+    tree.layout()
+    tree.children[0].style.layout = Style.Layout.Horizontal
+    assert tree.children[0].children[1].upper_left == (50, 2)
+
+
+def test_fixed_width_change_relays_out_siblings(tree):
+    tree.style.layout = Style.Layout.Horizontal
+    tree.layout()
+    tree.children[1].style.width = 20
+    changed = tree.layout()
+    assert tree not in changed
+    assert tree.children[0].width == 78
+    assert tree.children[1].upper_left == (79, 1)
+
+
+def test_fit_box_without_auto_siblings():
+    fit = Box(style=Style(width='fit'), children=[Box(style=Style(width=5))])
+    root = Box(
+        style=Style(layout=Style.Layout.Horizontal),
+        children=[Box(style=Style(width=10)), fit],
+    )
+    root.available_height = 20
+    root.available_width = 40
+    root.layout()
+    assert fit.width == 5
+    assert fit.upper_left == (9, 0)
+    assert fit.children[0].lower_right == (14, 21)
+
+
+def test_append_text():
+    box = Box()
+    assert box.text is None
+    box.append_text("one\n")
+    box.append_text("two\n")
+    assert box.text == "one\ntwo\n"
+    assert box.buffer[4:7] == "two"
+
+
+def test_scroll_is_bounded_by_line_count():
+    box = Box(text="".join("{}\n".format(i) for i in range(10)))
+    assert box.line_count == 10
+    box.scroll(4)
+    assert box._text_offset == 4
+    box.scroll(100)
+    assert box._text_offset == 9
+    box.scroll_to(-3)
+    assert box._text_offset == 0
+
+
+def test_max_lines_keeps_text_offset_on_same_lines():
+    box = Box(max_lines=5, text="0\n1\n2\n3\n4\n")
+    box.scroll(3)
+    box.append_text("5\n6\n")
+    assert box.text == "2\n3\n4\n5\n6\n"
+    assert box._text_offset == 1
+    box = Box(max_lines=2, text="a\nb\nc\nd\n")
+    assert box.text == "c\nd\n"
+    assert box.line_count == 2
+
+
+class Pad(object):
+    def __init__(self, lines, columns):
+        self.size = (lines, columns)
+        self.rows = {}
+
+    def getmaxyx(self):
+        return self.size
+
+    def erase(self):
+        self.rows = {}
+
+    def addnstr(self, y, x, text, n):
+        self.rows[y] = text[:n]
+
+
+def test_fill_pad_writes_visible_rows_and_overscan(application):
+    app = application
+    box = Box(text="".join("row {}\n".format(i) for i in range(100)))
+    box.available_height = 7
+    box.available_width = 20
+    pad = Pad(box.inner_height + 2 * app.overscan, box.inner_width)
+    window = Window(box, None, pad, None)
+    box.scroll_to(50)
+    app._fill_pad(window)
+    assert app._pad_starts[box] == 50 - app.overscan
+    assert pad.rows[0] == "row 40"
+    assert pad.rows[len(pad.rows) - 1] == "row 64"
+    assert app._pad_covers(window)
+    # Scrolling within the overscan needs no new rows...
+    box.scroll(app.overscan)
+    assert app._pad_covers(window)
+    # ...but past it does.
+    box.scroll(1)
+    assert not app._pad_covers(window)
+    box.scroll_to(50 - app.overscan - 1)
+    assert not app._pad_covers(window)
+
+
+def test_fill_pad_flows_text(application):
+    app = application
+    box = Box(text="one two three four", style=Style(flow=True))
+    box.available_height = 10
+    box.available_width = 11
+    pad = Pad(box.inner_height + 2 * app.overscan, box.inner_width)
+    app._fill_pad(Window(box, None, pad, None))
+    assert pad.rows == {0: "one two", 1: "three", 2: "four"}
+
+
+def test_on_binds_keys_and_events_apart(application):
+    app = application
+    box = Box()
+
+    @app.on('ready')
+    def ready(app):
+        pass
+
+    @app.on('j', box=box)
+    def down(app):
+        pass
+
+    @app.on('q')
+    def quit(app):
+        pass
+
+    assert list(app._registry) == ['ready']
+    assert 'q' in app.keymap.root.children
+    assert 'j' in app._keymaps[box].root.children
+    with pytest.raises(ValueError):
+        app.on('focus', ready, box=box)
+    # A box that leaves the layout takes its bindings with it.
+    app.remove_window(box)
+    assert box not in app._keymaps
+
+
+def test_run_coalesced(loop, application):
+    app = application
+    # Frames are not asked for while one is being drawn.
+    app._drawing_frame = True
+    errors = []
+    loop.set_exception_handler(lambda loop, context: errors.append(context))
+    calls = []
+
+    def down(app, count=1):
+        calls.append(('down', count))
+        raise RuntimeError
+
+    def mark(app):
+        calls.append(('mark', 1))
+
+    keymap = KeyMap()
+    keymap.bind('j', asyncio.coroutine(down), coalesce=True)
+    keymap.bind('x', asyncio.coroutine(mark), coalesce=True)
+    j = keymap.root.children['j'].bindings[0]
+    x = keymap.root.children['x'].bindings[0]
+    app._run_bindings([(j, 1), (x, 1), (j, 3), (x, 1)])
+    assert app.coalesced_keys == 4
+    assert list(app._coalesced.items()) == [(j, 4), (x, 2)]
+    loop.run_until_complete(app.run_coalesced())
+    assert calls == [('down', 4), ('mark', 1), ('mark', 1)]
+    assert len(errors) == 1
+    assert isinstance(errors[0]['exception'], RuntimeError)
+    assert not app._coalesced
+
+
+def test_schedule_drops_waiting_duplicates(loop, application):
+    app = application
+    runs = []
+
+    @asyncio.coroutine
+    def refresh(app, box=None):
+        runs.append(box)
+        return box
+
+    first = app.schedule(refresh, key='refresh')
+    assert app.schedule(refresh, key='refresh') is first
+    # With key=True, a partial's arguments are part of the key.
+    app.schedule(partial(refresh, box='a'), key=True)
+    app.schedule(partial(refresh, box='a'), key=True)
+    app.schedule(partial(refresh, box='b'), key=True)
+    # Arguments that cannot be hashed are scheduled every time.
+    app.schedule(partial(refresh, box=['c']), key=True)
+    app.schedule(partial(refresh, box=['c']), key=True)
+    loop.run_until_complete(first)
+    loop.run_until_complete(asyncio.sleep(0))
+    assert runs == [None, 'a', 'b', ['c'], ['c']]
+    assert app.coalesced_tasks == 2
+    assert not app._scheduled
+
+
+def test_schedule_frees_key_once_started(loop, application):
+    app = application
+    release = asyncio.Event()
+    runs = []
+
+    @asyncio.coroutine
+    def refresh(app):
+        runs.append(len(runs))
+        yield from release.wait()
+
+    first = app.schedule(refresh, key=True)
+    loop.run_until_complete(asyncio.sleep(0))
+    assert runs == [0]
+    # Started, so scheduling again is not dropped.
+    second = app.schedule(refresh, key=True)
+    assert second is not first
+    release.set()
+    loop.run_until_complete(asyncio.wait([first, second]))
+    assert runs == [0, 1]
+    assert app.coalesced_tasks == 0
+    # A key cancelled before it starts is freed too.
+    app.schedule(refresh, key=True).cancel()
+    loop.run_until_complete(asyncio.sleep(0))
+    assert not app._scheduled
+
+
+class Mounted(Box):
+    def __init__(self, *args, **kwargs):
+        super(Mounted, self).__init__(*args, **kwargs)
+        self.mounts = []
+
+    def mount(self, app):
+        self.mounts.append('mount')
+
+    def unmount(self, app):
+        self.mounts.append('unmount')
+
+
+def show(app, root):
+    app.root = root
+    root.application = app
+    app.recalculate_windows()
+    return app
+
+
+def test_window_pool_reuses_windows_whose_rect_is_unchanged(application):
+    a, b = Box(), Box()
+    app = show(application, Box(children=(a, b)))
+    windows = dict(app._window_pool)
+    calls = {box: list(windows[box].win.calls) for box in windows}
+    a.add_child(Box())
+    app.recalculate_windows()
+    for box in (app.root, a, b):
+        assert app._window_pool[box] is windows[box]
+        assert windows[box].win.calls == calls[box]
+
+
+def test_window_pool_reshapes_windows_whose_rect_changed(application):
+    a, b = Box(), Box()
+    app = show(application, Box(children=(a, b)))
+    windows = dict(app._window_pool)
+    for box in windows:
+        del windows[box].win.calls[:]
+    b.style.height = 10
+    app.recalculate_windows()
+    for box in windows:
+        assert app._window_pool[box].win is windows[box].win
+    assert windows[app.root].win.calls == []
+    # Only the height of the box above changes...
+    assert windows[a].win.calls == [('resize', 31, 100), ('mvwin', 0, 0),
+                                    ('erase',)]
+    # ...but the box below moves too.
+    assert windows[b].win.calls == [('resize', 10, 100), ('mvwin', 30, 0),
+                                    ('erase',)]
+
+
+def test_remove_window_unmounts_box(application):
+    box = Mounted()
+    app = show(application, Box(children=(box,)))
+    assert box.mounts == ['mount']
+    app.damaged.add(box)
+    app.remove_window(box)
+    assert box not in app._window_pool
+    assert box not in app.damaged
+    assert box.mounts == ['mount', 'unmount']
+    # A box that was not shown is not unmounted.
+    app.remove_window(box)
+    assert box.mounts == ['mount', 'unmount']
+
+
+def staged(windows):
+    return [window.box.title for window in windows]
+
+
+def test_repaint_stages_damaged_boxes_and_subtrees_in_order(application):
+    aa, ab = Box(title='AA'), Box(title='AB')
+    a = Box(
+        title='A',
+        style=Style(border_collapse=False),
+        children=(aa, ab),
+    )
+    b = Box(title='B')
+    app = show(application, Box(
+        style=Style(border_collapse=False),
+        children=(a, b),
+    ))
+    app.repaint_windows()
+    b.damage()
+    aa.damage()
+    assert staged(app.repaint_windows()) == ['AA', 'B']
+    a.damage()
+    assert staged(app.repaint_windows()) == ['A', 'AA', 'AB']
+    assert app.repaint_windows() == []
+    # Without a redraw of its own, a child is staged again after the box it
+    # is in, not before.
+    aa.damage(contents=False)
+    a.damage()
+    windows = app.repaint_windows()
+    assert staged(windows) == ['A', 'AA', 'AB']
+    assert ('touchwin',) in windows[1].win.calls
+
+
+def test_repaint_restages_boxes_sharing_a_collapsed_border(application):
+    aa, ab = Box(title='AA'), Box(title='AB')
+    a, b = Box(title='A', children=(aa, ab)), Box(title='B')
+    app = show(application, Box(children=(a, b)))
+    app.repaint_windows()
+    # Drawing the border of A draws over the top border of B.
+    a.damage()
+    assert staged(app.repaint_windows()) == ['A', 'AA', 'AB', 'B']
+    # Drawing the border of AB does too, where it meets B.
+    ab.damage()
+    windows = app.repaint_windows()
+    assert staged(windows) == ['AB', 'B']
+    assert ('touchwin',) in windows[1].win.calls
+    # A box only scrolled within its pad leaves its border alone.
+    ab.damage(contents=False)
+    assert staged(app.repaint_windows()) == ['AB']
+
+
+def test_repaint_does_not_refill_a_pad_that_covers_a_scroll(application):
+    box = Box(text="".join("{}\n".format(i) for i in range(100)))
+    app = show(application, Box(children=(box,)))
+    app.repaint_windows()
+    pad = app._window_pool[box].pad
+    del pad.calls[:]
+    # The pad holds the overscan either side of the rows on show.
+    box.scroll(2 * app.overscan)
+    app.repaint_windows()
+    assert pad.calls == [('touchwin',)]
+    box.scroll(1)
+    app.repaint_windows()
+    assert ('erase',) in pad.calls
+    assert pad.rows[0] == "11"
+
+
+def test_commit_frame_updates_the_terminal_once(application):
+    a, b = Box(), Box()
+    app = show(application, Box(children=(a, b)))
+    windows = app.repaint_windows()
+    app.commit_frame(windows)
+    for window in windows:
+        assert window.win.calls[-1] == ('noutrefresh',)
+        assert window.pad.calls[-1][0] == 'noutrefresh'
+    assert app.stdscr.calls == [('noutrefresh',), ('doupdate',)]
+
+
+def spin(loop, times=5):
+    # Enough passes of the loop for a due frame to be scheduled and drawn.
+    for _ in range(times):
+        loop.run_until_complete(asyncio.sleep(0))
+
+
+def test_request_render_waits_out_max_fps(loop, application):
+    clock = [100.0]
+    loop.time = lambda: clock[0]
+    box = Box()
+    app = show(application, Box(children=(box,)))
+    # The first frame is not held back.
+    handle = app._frame_handle
+    assert handle._when == 100.0
+    # Requests made while it waits are folded into it.
+    coalesced = app.coalesced_frames
+    app.request_render()
+    app.damage(box)
+    assert app._frame_handle is handle
+    assert app.coalesced_frames == coalesced + 2
+    spin(loop)
+    assert app._frame_handle is None
+    assert app._last_frame == 100.0
+    assert not app.damaged
+    clock[0] = 100.01
+    app.damage(box)
+    assert app._frame_handle._when == 100.0 + 1 / app.max_fps
+    spin(loop)
+    assert box in app.damaged
+    clock[0] = 100.04
+    spin(loop)
+    assert not app.damaged
+    assert app._last_frame == 100.04
+
+
+def test_damage_during_a_frame_is_drawn_in_it(loop, application):
+    clock = [100.0]
+    loop.time = lambda: clock[0]
+    box = Box()
+    app = show(application, Box(children=(box,)))
+    spin(loop)
+
+    @asyncio.coroutine
+    def change(app):
+        box.append_text("changed\n")
+
+    app.keymap.bind('c', change, coalesce=True)
+    app._run_bindings([(app.keymap.root.children['c'].bindings[0], 1)])
+    coalesced = app.coalesced_frames
+    clock[0] = 101.0
+    spin(loop)
+    assert not app.damaged
+    assert app._frame_handle is None
+    assert app.coalesced_frames == coalesced
+    assert app._window_pool[box].pad.rows[0] == "changed"
+
+
+def test_keys_coalesced_mid_frame_ask_for_another(loop, application):
+    clock = [100.0]
+    loop.time = lambda: clock[0]
+    app = show(application, Box())
+    spin(loop)
+    gate = asyncio.Future(loop=loop)
+    calls = []
+
+    @asyncio.coroutine
+    def down(app, count=1):
+        calls.append(count)
+        if len(calls) == 1:
+            yield from gate
+
+    app.keymap.bind('j', down, coalesce=True)
+    j = app.keymap.root.children['j'].bindings[0]
+    app._run_bindings([(j, 1)])
+    clock[0] = 101.0
+    spin(loop)
+    # The frame is waiting on the handler; keys typed now are not folded
+    # into it, as its handlers have already been taken.
+    assert app._drawing_frame
+    app._run_bindings([(j, 2)])
+    assert app._frame_handle is None
+    gate.set_result(None)
+    spin(loop)
+    assert not app._drawing_frame
+    assert app._frame_handle is not None
+    clock[0] = 102.0
+    spin(loop)
+    assert calls == [1, 2]
+    assert not app._coalesced
+
+
+def test_process_key_drains_every_waiting_key(loop, application):
+    app = application
+    calls = []
+
+    @asyncio.coroutine
+    def down(app):
+        calls.append(('down', list(app.key_batch)))
+
+    @asyncio.coroutine
+    def top(app):
+        calls.append(('top', list(app.key_batch)))
+
+    app.keymap.bind('j', down)
+    app.keymap.bind('g g', top)
+    app.stdscr.keys.extend(map(ord, 'jgjg'))
+    app._process_key()
+    assert not app.stdscr.keys
+    assert app.key_batch == ['j', 'g', 'j', 'g']
+    # The last g may start "g g", so the next key is waited for.
+    assert app._sequencer.pending
+    app.stdscr.keys.append(ord('g'))
+    app._process_key()
+    assert app.key_batch == ['g']
+    # A wakeup with nothing to read leaves the last batch alone.
+    app._process_key()
+    assert app.key_batch == ['g']
+    spin(loop)
+    # By the time the handlers of the first batch run, it has been replaced.
+    assert calls == [('down', ['g']), ('down', ['g']), ('top', ['g'])]
@@ -0,0 +1,113 @@
+from hexes.keys import (
+    KeyMap,
+    KeySequencer,
+    PasteParser,
+    parse_keys,
+)
+
+
+def codes(text):
+    return [ord(ch) for ch in text]
+
+
+def test_paste_parser_passes_keys_through():
+    parser = PasteParser()
+    assert parser.feed(codes("jk\x1b")) == codes("jk\x1b")
+    assert parser.feed([260]) == [260]
+
+
+def test_paste_parser_gathers_paste_across_reads():
+    parser = PasteParser()
+    assert parser.feed(codes("a\x1b[200~hel")) == [ord("a")]
+    assert parser.pasting
+    assert parser.feed(codes("lo\rwor")) == []
+    assert parser.feed(codes("ld\x1b[20")) == []
+    assert parser.feed(codes("1~b")) == ["hello\nworld", ord("b")]
+    assert not parser.pasting
+
+
+def test_paste_parser_decodes_utf8():
+    parser = PasteParser()
+    pasted = list("\x1b[200~".encode()) + list("héx".encode())
+    pasted += list("\x1b[201~".encode())
+    assert parser.feed(pasted) == ["héx"]
+
+
+def test_parse_keys():
+    assert parse_keys(" ") == (" ",)
+    assert parse_keys("g g") == ("g", "g")
+    assert parse_keys("C-x C-s") == ("\x18", "\x13")
+    assert parse_keys("KEY_LEFT") == ("KEY_LEFT",)
+
+
+def handlers(bindings):
+    return [(binding.handler, count) for binding, count in bindings]
+
+
+def test_key_sequencer_sequences_and_counts():
+    keymap = KeyMap()
+    keymap.bind("j", "down")
+    keymap.bind("g g", "top")
+    keymap.bind("C-x C-s", "save")
+    sequencer = KeySequencer()
+    assert handlers(sequencer.feed("j", [keymap])) == [("down", 1)]
+    assert sequencer.feed("g", [keymap]) == []
+    assert sequencer.pending
+    assert handlers(sequencer.feed("g", [keymap])) == [("top", 1)]
+    for key in "10":
+        assert sequencer.feed(key, [keymap]) == []
+    # Counts do not time out.
+    assert sequencer.timeout() == []
+    assert handlers(sequencer.feed("j", [keymap])) == [("down", 10)]
+    assert sequencer.feed("\x18", [keymap]) == []
+    assert handlers(sequencer.feed("\x13", [keymap])) == [("save", 1)]
+    # A sequence that goes nowhere is dropped, and the key that ended it
+    # starts again.
+    assert sequencer.feed("g", [keymap]) == []
+    assert handlers(sequencer.feed("j", [keymap])) == [("down", 1)]
+    assert not sequencer.pending
+
+
+def test_key_sequencer_waits_on_ambiguous_sequences():
+    keymap = KeyMap()
+    keymap.bind("d", "delete")
+    keymap.bind("d d", "delete line")
+    sequencer = KeySequencer()
+    assert sequencer.feed("d", [keymap]) == []
+    assert handlers(sequencer.timeout()) == [("delete", 1)]
+    sequencer.feed("d", [keymap])
+    assert handlers(sequencer.feed("x", [keymap])) == [("delete", 1)]
+
+
+def test_key_sequencer_scopes():
+    outer, inner = KeyMap(), KeyMap()
+    outer.bind("q", "quit")
+    outer.bind("1", "first")
+    inner.bind("q", "close")
+    sequencer = KeySequencer()
+    assert handlers(sequencer.feed("q", [inner, outer])) == [("close", 1)]
+    assert handlers(sequencer.feed("q", [outer])) == [("quit", 1)]
+    # Bound digits are keys, not counts.
+    assert handlers(sequencer.feed("1", [outer])) == [("first", 1)]
+
+
+def test_key_sequencer_counts_only_ascii_digits():
+    keymap = KeyMap()
+    keymap.bind("j", "down")
+    sequencer = KeySequencer()
+    # A superscript two is a digit to str.isdigit, but not a count.
+    assert sequencer.feed("\u00b2", [keymap]) == []
+    assert not sequencer.pending
+    sequencer.feed("2", [keymap])
+    assert handlers(sequencer.feed("j", [keymap])) == [("down", 2)]
+
+
+def test_key_map_passes_counts_to_handlers_that_take_them():
+    keymap = KeyMap()
+    keymap.bind("j", lambda app, count=1: None)
+    keymap.bind("k", lambda app: None, coalesce=True)
+    j, k = keymap.root.children["j"], keymap.root.children["k"]
+    assert j.bindings[0].takes_count
+    assert not j.bindings[0].coalesce
+    assert not k.bindings[0].takes_count
+    assert k.bindings[0].coalesce
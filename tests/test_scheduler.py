@@ -0,0 +1,72 @@
+import asyncio
+import pytest
+from hexes.scheduler import (
+    BACKGROUND,
+    INPUT,
+    RENDER,
+    Scheduler,
+)
+
+
+def test_scheduler_starts_in_priority_order(loop):
+    scheduler = Scheduler(loop)
+    started = []
+
+    @asyncio.coroutine
+    def job(name):
+        started.append(name)
+
+    for name, priority in [
+        ("data", BACKGROUND),
+        ("frame", RENDER),
+        ("key", INPUT),
+    ]:
+        scheduler.submit(job(name), priority)
+    loop.run_until_complete(asyncio.sleep(0.01))
+    assert started == ["key", "frame", "data"]
+    assert scheduler.pending == 0
+
+
+def test_scheduler_budgets_background_work(loop):
+    # Every job takes 2ms by this clock, however long it really takes.
+    clock = [0.0]
+    loop.time = lambda: clock[0]
+    scheduler = Scheduler(loop, budget=0.004)
+    started = []
+
+    @asyncio.coroutine
+    def job(name):
+        started.append(name)
+        clock[0] += 0.002
+
+    for i in range(50):
+        scheduler.submit(job(i))
+    loop.run_until_complete(asyncio.sleep(0))
+    # A key typed behind a backlog of background work does not wait for it
+    # all.
+    scheduler.submit(job("key"), INPUT)
+    while len(started) < 51:
+        loop.run_until_complete(asyncio.sleep(0))
+    assert started.index("key") < 10
+    assert abs(scheduler.cost - 0.002) < 1e-6
+
+
+def test_scheduler_futures(loop):
+    scheduler = Scheduler(loop)
+
+    @asyncio.coroutine
+    def job(value):
+        return value
+
+    @asyncio.coroutine
+    def fail():
+        raise ValueError
+
+    done = scheduler.submit(job(1))
+    failed = scheduler.submit(fail())
+    never = scheduler.submit(job(2))
+    never.cancel()
+    assert loop.run_until_complete(done) == 1
+    with pytest.raises(ValueError):
+        loop.run_until_complete(failed)
+    assert scheduler.pending == 0
@@ -0,0 +1,48 @@
+import asyncio
+from hexes.hexes import Box
+from hexes.sources import StreamSource
+
+
+class App(object):
+    def __init__(self):
+        self.requests = 0
+
+    def request_render(self):
+        self.requests += 1
+
+
+def test_stream_source_batches_lines(loop):
+    reader = asyncio.StreamReader()
+    reader.feed_data(b"one\ntwo\nthree")
+    reader.feed_eof()
+    box = Box()
+    app = App()
+    source = StreamSource(box, reader)
+    loop.run_until_complete(source.pump(app))
+    assert source.finished
+    assert box.text is None
+    source.flush()
+    assert box.text == "one\ntwo\nthree\n"
+    assert app.requests == 2
+
+
+def test_stream_source_applies_backpressure(loop):
+    reader = asyncio.StreamReader()
+    reader.feed_data(b"".join(b"line\n" for _ in range(5)))
+    reader.feed_eof()
+    box = Box()
+    source = StreamSource(box, reader, max_pending=2)
+    task = loop.create_task(source.pump(App()))
+    loop.run_until_complete(asyncio.sleep(0.01))
+    assert source.pending == 2
+    assert not task.done()
+    source.flush()
+    loop.run_until_complete(asyncio.sleep(0.01))
+    assert box.line_count == 2
+    assert source.pending == 2
+    while not task.done():
+        source.flush()
+        loop.run_until_complete(asyncio.sleep(0.01))
+    source.flush()
+    assert box.line_count == 5
+    assert source.finished
@@ -0,0 +1,135 @@
+import random
+from hexes.text import (
+    GapBuffer,
+    HexDump,
+    LineRing,
+    MappedText,
+    Rope,
+)
+
+
+def test_rope_append():
+    rope = Rope(chunk_size=4)
+    for word in ("hello", " ", "world", "\n"):
+        rope.append(word)
+    assert str(rope) == "hello world\n"
+    assert len(rope) == 12
+
+
+def test_rope_insert_and_slice():
+    rope = Rope("hello world", chunk_size=3)
+    rope.insert(5, ",")
+    assert str(rope) == "hello, world"
+    assert rope[3:9] == "lo, wo"
+    assert rope[-1] == "d"
+
+
+def test_rope_matches_str_under_random_edits():
+    rnd = random.Random(0)
+    rope = Rope(chunk_size=8)
+    expected = ""
+    for _ in range(500):
+        text = "".join(rnd.choice("ab\n") for _ in range(rnd.randint(1, 20)))
+        if rnd.random() < 0.5:
+            rope.append(text)
+            expected += text
+        else:
+            index = rnd.randint(0, len(expected))
+            rope.insert(index, text)
+            expected = expected[:index] + text + expected[index:]
+    assert str(rope) == expected
+    start = rnd.randint(0, len(expected))
+    assert rope[start:start + 50] == expected[start:start + 50]
+    # Stays balanced: far shallower than one level per chunk.
+    assert rope._root.height < 20
+
+
+def test_rope_line_index():
+    text = "".join("line {}\n".format(i) for i in range(100)) + "tail"
+    rope = Rope(chunk_size=16)
+    for line in text.splitlines(True):
+        rope.append(line)
+    assert rope.line_count == 100
+    assert rope.line_start(0) == 0
+    assert rope.line_start(10) == text.index("line 10\n")
+    assert rope.lines(98, 102) == ["line 98", "line 99", "tail"]
+    rope.insert(0, "first\n")
+    assert rope.line_count == 101
+    assert rope.lines(0, 2) == ["first", "line 0"]
+
+
+def test_line_ring_evicts_oldest_lines():
+    ring = LineRing(max_lines=3)
+    for i in range(10):
+        assert ring.append("line {}\n".format(i)) == (1 if i >= 3 else 0)
+    ring.append("partial")
+    assert ring.line_count == 3
+    assert ring.evicted == 7
+    assert str(ring) == "line 7\nline 8\nline 9\npartial"
+    assert ring.lines(1, 10) == ["line 8", "line 9", "partial"]
+
+
+def test_line_ring_byte_budget():
+    ring = LineRing("aaaa\nbbbb\n", max_bytes=12)
+    assert ring.append("cccc\n") == 1
+    assert str(ring) == "bbbb\ncccc\n"
+    assert len(ring) == 10
+
+
+def test_mapped_text_indexes_lazily(tmpdir):
+    path = tmpdir.join("log.txt")
+    path.write("".join("line {}\n".format(i) for i in range(1000)) + "end")
+    text = MappedText(str(path), chunk_size=64)
+    assert text.line_count == 0
+    assert not text.index_step(chunks=2)
+    assert 0 < text.line_count < 1000
+    while not text.index_step():
+        pass
+    assert text.line_count == 1000
+    assert text.lines(0, 2) == ["line 0", "line 1"]
+    assert text.lines(998, 1005) == ["line 998", "line 999", "end"]
+    assert text.line_start(500) == str(path.read()).index("line 500\n")
+    text.close()
+
+
+def test_mapped_text_empty_file(tmpdir):
+    path = tmpdir.join("empty.txt")
+    path.write("")
+    text = MappedText(str(path))
+    assert text.index_step()
+    assert text.lines(0, 10) == []
+
+
+def test_hex_dump_formats_rows(tmpdir):
+    path = tmpdir.join("core")
+    path.write_binary(bytes(range(40)) + b"hexes")
+    dump = HexDump(str(path), cache_size=2)
+    assert dump.line_count == 3
+    assert dump.lines(0, 1) == [
+        "00000000  00 01 02 03 04 05 06 07  08 09 0a 0b 0c 0d 0e 0f"
+        "  |................|"
+    ]
+    assert dump.lines(2, 5) == [
+        "00000020  20 21 22 23 24 25 26 27  68 65 78 65 73         "
+        "  | !\"#$%&'hexes|"
+    ]
+    assert dump.row_of(33) == 2
+    dump.lines(0, 3)
+    assert list(dump._rows) == [1, 2]
+
+
+def test_gap_buffer_edits_at_cursor():
+    buffer = GapBuffer("world", gap=2)
+    buffer.move(0)
+    buffer.insert("hello ")
+    assert str(buffer) == "hello world"
+    assert buffer.cursor == 6
+    buffer.move(100)
+    buffer.insert("!")
+    buffer.move(5)
+    buffer.delete()
+    buffer.backspace(2)
+    assert str(buffer) == "helworld!"
+    assert len(buffer) == 9
+    buffer.backspace(100)
+    assert str(buffer) == "world!"
@@ -1,4 +1,5 @@
 from hexes.utils import (
+    WrapCache,
     flatten,
     wrap_by_paragraph,
 )
@@ -44,3 +45,17 @@ def test_wrap_by_paragraph():
     """.strip()
     actual = wrap_by_paragraph(s, width=7)
     assert actual == expected
+
+
+def test_wrap_by_paragraph_with_cache():
+    cache = WrapCache(maxsize=2)
+    text = "aaa bbb\n\nccc ddd"
+    expected = wrap_by_paragraph(text, width=3)
+    assert wrap_by_paragraph(text, width=3, cache=cache) == expected
+    assert (cache.hits, cache.misses) == (0, 2)
+    wrap_by_paragraph(text + "\n\neee", width=3, cache=cache)
+    assert (cache.hits, cache.misses) == (2, 3)
+    # The least recently used paragraph has been evicted.
+    assert len(cache) == 2
+    wrap_by_paragraph("aaa bbb", width=3, cache=cache)
+    assert cache.misses == 4
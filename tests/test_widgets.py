@@ -0,0 +1,62 @@
+from hexes.widgets import (
+    FileBox,
+    HexBox,
+)
+
+
+def test_file_box_scrolls_over_indexed_lines(tmpdir):
+    path = tmpdir.join("log.txt")
+    path.write("".join("line {}\n".format(i) for i in range(100)))
+    box = FileBox(str(path))
+    box.scroll(50)
+    assert box._text_offset == 0
+    while not box.buffer.index_step():
+        pass
+    box.scroll(50)
+    assert box._text_offset == 50
+    assert box.buffer.lines(50, 51) == ["line 50"]
+
+
+def test_hex_box_jump(tmpdir):
+    path = tmpdir.join("core")
+    path.write_binary(bytes(1000))
+    box = HexBox(str(path))
+    box.jump(500)
+    assert box._text_offset == 31
+
+
+class App(object):
+    def __init__(self):
+        self.scheduled = []
+
+    def schedule(self, coro_func):
+        self.scheduled.append(coro_func)
+
+
+def test_file_box_unmount_closes_the_file(tmpdir, loop):
+    path = tmpdir.join("log.txt")
+    path.write("".join("line {}\n".format(i) for i in range(100)))
+    box = FileBox(str(path))
+    app = App()
+    box.mount(app)
+    buffer = box.buffer
+    box.unmount(app)
+    assert buffer.closed
+    # Indexing stops rather than read the closed mapping.
+    loop.run_until_complete(app.scheduled[0](app))
+    box.mount(app)
+    assert not box.buffer.closed
+    loop.run_until_complete(app.scheduled[1](app))
+    assert box.buffer.complete
+    assert box.buffer.lines(99, 100) == ["line 99"]
+
+
+def test_hex_box_unmount_closes_the_file(tmpdir):
+    path = tmpdir.join("core")
+    path.write_binary(b"hexes")
+    box = HexBox(str(path))
+    buffer = box.buffer
+    box.unmount(App())
+    assert buffer.closed
+    box.mount(App())
+    assert box.buffer.lines(0, 1)[0].endswith("|hexes|")